@@ -0,0 +1,208 @@
+"""Offline performance benchmark for the face processing pipeline.
+
+Runs without a live server: images are generated deterministically (seeded
+background noise with drawn faces the Haar cascade detects) at several
+resolutions and face counts, each pipeline stage is timed in-process, and the
+endpoints are called through the Flask test client.
+
+    python benchmark.py                           # run and print p50/p95/p99
+    python benchmark.py --save-baseline           # store results as the baseline
+    python benchmark.py --compare                 # fail if slower than the baseline
+    python benchmark.py --filter detect --iterations 50
+
+The result cache is disabled so repeated images measure the full pipeline;
+pass --with-cache to measure cache hits instead. Baselines are only
+comparable on the same machine and settings.
+"""
+import argparse
+import base64
+import importlib
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import cv2
+import numpy as np
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+FACE_COUNTS = [0, 1, 3]
+SEED = 1234
+
+def draw_face(image, cx: int, cy: int, size: int):
+    """Draw a frontal cartoon face of the given width centred on (cx, cy)"""
+    cv2.ellipse(image, (cx, cy), (size // 2, int(size * 0.62)), 0, 0, 360, (150, 170, 205), -1)
+    eye_y = cy - size // 8
+    eye_dx = size // 5
+    for side in (-1, 1):
+        eye_x = cx + side * eye_dx
+        cv2.ellipse(image, (eye_x, eye_y - size // 9), (size // 8, size // 30 + 1), 0, 180, 360, (40, 40, 60), max(2, size // 30))
+        cv2.ellipse(image, (eye_x, eye_y), (size // 10, size // 20 + 1), 0, 0, 360, (245, 245, 245), -1)
+        cv2.circle(image, (eye_x, eye_y), max(2, size // 24), (30, 25, 20), -1)
+    nose = np.array([[cx, eye_y + size // 20], [cx - size // 14, cy + size // 6], [cx + size // 14, cy + size // 6]], np.int32)
+    cv2.fillPoly(image, [nose], (120, 140, 180))
+    cv2.ellipse(image, (cx, cy + size // 3), (size // 6, size // 20 + 1), 0, 0, 180, (60, 60, 150), max(2, size // 25))
+
+def make_image(width: int, height: int, faces: int, seed: int = SEED) -> np.ndarray:
+    """Deterministic BGR test frame with `faces` faces in a row"""
+    rng = np.random.default_rng(seed + width * 7 + faces)
+    image = rng.normal(90, 20, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    image = cv2.GaussianBlur(image, (0, 0), 3)
+    size = int(min(width, height) * (0.3 if faces <= 1 else 0.2))
+    for i in range(faces):
+        draw_face(image, int(width * (i + 1) / (faces + 1)), height // 2, size)
+    return cv2.GaussianBlur(image, (0, 0), max(1.0, size / 80))
+
+def to_base64(image: np.ndarray) -> str:
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("Could not encode benchmark image")
+    return base64.b64encode(buffer.tobytes()).decode('ascii')
+
+def load_api(with_cache: bool):
+    if not with_cache:
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+    sys.path.insert(0, SRC_DIR)
+    logging.disable(logging.CRITICAL)
+    return importlib.import_module('api-clean')
+
+def measure(fn, iterations: int, warmup: int) -> dict:
+    """Latency percentiles (ms) and throughput (calls/s) of a no-argument callable"""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(iterations, dtype=np.float64)
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples[i] = time.perf_counter() - t0
+    elapsed = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(samples * 1000, [50, 95, 99])
+    return {
+        "iterations": iterations,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(samples.mean() * 1000), 3),
+        "throughput_per_s": round(iterations / elapsed, 2)
+    }
+
+def post_ok(client, path: str, payload: dict):
+    def call():
+        response = client.post(path, json=payload)
+        if response.status_code >= 500:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)}")
+    return call
+
+def build_cases(api) -> list:
+    """(name, callable) pairs for every stage and endpoint benchmark"""
+    cases = []
+    client = api.app.test_client()
+    features = {}
+
+    for width, height in RESOLUTIONS:
+        for faces in FACE_COUNTS:
+            image = make_image(width, height, faces)
+            image_b64 = to_base64(image)
+            label = f"{width}x{height}/{faces}f"
+
+            cases.append((f"base64_to_image[{label}]", lambda b=image_b64: api.base64_to_image(b)))
+            cases.append((f"detect_faces[{label}]", lambda i=image: api.detect_faces(i)))
+            cases.append((f"analyze_enhanced_face_quality[{label}]", lambda b=image_b64: api.analyze_enhanced_face_quality(b)))
+            cases.append((f"extract_face_features[{label}]", lambda b=image_b64: api.extract_face_features(b)))
+            cases.append((f"POST /process/recognize[{label}]", post_ok(client, '/process/recognize', {"image": image_b64})))
+            cases.append((f"POST /process/checkin[{label}]", post_ok(client, '/process/checkin', {"image": image_b64})))
+
+            if faces == 1:
+                features[label] = api.extract_face_features(image_b64)
+                frames = [to_base64(make_image(width, height, 1, seed=SEED + i)) for i in range(api.REGISTRATION_MAX_FRAMES)]
+                cases.append((f"POST /process/register[{label}]", post_ok(client, '/process/register', {
+                    "employeeId": "bench-001",
+                    "employeeName": "Benchmark Employee",
+                    "videoFrames": frames
+                })))
+
+    vectors = list(features.values())
+    if len(vectors) >= 2 and all(vectors):
+        cases.append(("calculate_face_similarity", lambda: api.calculate_face_similarity(vectors[0], vectors[1])))
+    return cases
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+def print_results(results: dict):
+    print(f"{'benchmark':<52} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9}")
+    for name, r in results.items():
+        print(f"{name:<52} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_per_s']:>9.1f}")
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    """Print p50/p95 changes against the baseline; return the number of regressions"""
+    regressions = 0
+    print(f"\n{'benchmark':<52} {'base p50':>9} {'p50':>9} {'change':>8}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<52} {'-':>9} {r['p50_ms']:>9.2f}      new")
+            continue
+        change = r['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        regressed = change > tolerance or (base['p95_ms'] and r['p95_ms'] / base['p95_ms'] - 1 > 2 * tolerance)
+        regressions += bool(regressed)
+        print(f"{name:<52} {base['p50_ms']:>9.2f} {r['p50_ms']:>9.2f} {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the face processing pipeline")
+    parser.add_argument('--iterations', type=int, default=20, help="timed calls per benchmark")
+    parser.add_argument('--warmup', type=int, default=3, help="untimed calls before timing")
+    parser.add_argument('--filter', default='', help="only run benchmarks whose name contains this text")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results to the baseline file")
+    parser.add_argument('--compare', action='store_true', help="compare with the baseline; exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed p50 slowdown ratio (p95 gets twice this)")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    parser.add_argument('--with-cache', action='store_true', help="keep the result cache enabled")
+    args = parser.parse_args()
+
+    api = load_api(args.with_cache)
+    results = {}
+    for name, fn in build_cases(api):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, args.iterations, args.warmup)
+        print(f"  {name}: p50 {results[name]['p50_ms']:.2f} ms", file=sys.stderr)
+
+    print_results(results)
+    report = {"environment": environment(), "results": results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != report["environment"]:
+            print("\nWarning: baseline was recorded in a different environment")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{regressions} benchmark(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Recall-versus-latency evaluation of the quantized gallery index.
+
+Builds a deterministic synthetic gallery (clustered identities with several
+noisy templates each, so neighbours are not trivially separable), then runs
+the same probes through exhaustive float search (FaceGallery) and through
+QuantizedFaceGallery at several nprobe settings.
+
+    python evaluate_index.py                                  # 100k templates
+    python evaluate_index.py --templates 20000 --nprobe 1,4,16 --rerank 32,128
+
+For each setting it reports recall@1 and recall@k against the exhaustive
+top-k employees, p50/p99 latency of a single-probe search, and the index
+memory footprint.
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from face_gallery import FaceGallery
+from face_index import QuantizedFaceGallery
+
+def synthetic_gallery(templates: int, per_employee: int, dim: int, seed: int):
+    """(template features, employee ids, probe features) with clustered identities"""
+    rng = np.random.default_rng(seed)
+    employees = templates // per_employee
+    groups = rng.normal(size=(max(1, employees // 50), dim))
+    identities = groups[rng.integers(len(groups), size=employees)] + 0.6 * rng.normal(size=(employees, dim))
+    owner = np.repeat(np.arange(employees), per_employee)
+    features = identities[owner] + 0.35 * rng.normal(size=(len(owner), dim))
+    return features.astype(np.float32), owner, identities
+
+def probes_for(identities: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    chosen = identities[rng.integers(len(identities), size=count)]
+    return (chosen + 0.35 * rng.normal(size=chosen.shape)).astype(np.float32)
+
+def timed_search(gallery, probes: np.ndarray, k: int):
+    results, latencies = [], []
+    for probe in probes:
+        started = time.perf_counter()
+        results.append(gallery.search(probe, k))
+        latencies.append(time.perf_counter() - started)
+    return results, np.asarray(latencies) * 1000
+
+def recall(truth: list, found: list, k: int) -> tuple:
+    top1 = np.mean([bool(t) and bool(f) and t[0]["employee_id"] == f[0]["employee_id"] for t, f in zip(truth, found)])
+    at_k = np.mean([
+        len({m["employee_id"] for m in t[:k]} & {m["employee_id"] for m in f[:k]}) / max(1, len(t[:k]))
+        for t, f in zip(truth, found)
+    ])
+    return float(top1), float(at_k)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of the quantized gallery index")
+    parser.add_argument('--templates', type=int, default=100000)
+    parser.add_argument('--per-employee', type=int, default=3, help="templates per employee")
+    parser.add_argument('--dim', type=int, default=64)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--nprobe', default='1,2,4,8,16,32', help="comma-separated nprobe values")
+    parser.add_argument('--rerank', default='64', help="comma-separated shortlist sizes")
+    parser.add_argument('--nlist', type=int, default=0, help="IVF lists (0 = sqrt of gallery size)")
+    parser.add_argument('--rerank-dtype', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    features, owner, identities = synthetic_gallery(args.templates, args.per_employee, args.dim, args.seed)
+    probes = probes_for(identities, args.queries, args.seed)
+    print(f"Gallery: {len(features)} templates, {len(identities)} employees, dim {args.dim}; {len(probes)} probes")
+
+    exact = FaceGallery()
+    started = time.perf_counter()
+    for i, (vector, employee) in enumerate(zip(features, owner)):
+        exact.add(f"t{i}", f"e{employee}", vector)
+    print(f"Exhaustive gallery built in {time.perf_counter() - started:.1f} s")
+    truth, exact_ms = timed_search(exact, probes, args.k)
+
+    quantized = QuantizedFaceGallery(nlist=args.nlist, rerank_dtype=args.rerank_dtype, seed=args.seed)
+    started = time.perf_counter()
+    for i, (vector, employee) in enumerate(zip(features, owner)):
+        quantized.add(f"t{i}", f"e{employee}", vector)
+    quantized.train()
+    stats = quantized.stats()
+    print(f"Quantized gallery built and trained in {time.perf_counter() - started:.1f} s "
+          f"({stats['index']}, {stats['nlist']} lists)\n")
+
+    print(f"{'search':<28} {'recall@1':>9} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'memory MB':>10}")
+    exact_mb = exact.stats()["matrix_bytes"] / 1e6
+    print(f"{'exhaustive float32':<28} {1.0:>9.3f} {1.0:>9.3f} {np.percentile(exact_ms, 50):>8.3f} "
+          f"{np.percentile(exact_ms, 99):>8.3f} {exact_mb:>10.1f}")
+
+    for rerank in [int(v) for v in args.rerank.split(',')]:
+        for nprobe in [int(v) for v in args.nprobe.split(',')]:
+            quantized.nprobe = nprobe
+            quantized.rerank = rerank
+            found, ms = timed_search(quantized, probes, args.k)
+            top1, at_k = recall(truth, found, args.k)
+            label = f"nprobe={nprobe} rerank={rerank}"
+            print(f"{label:<28} {top1:>9.3f} {at_k:>9.3f} {np.percentile(ms, 50):>8.3f} "
+                  f"{np.percentile(ms, 99):>8.3f} {stats['index_bytes'] / 1e6:>10.1f}")
+
+    print(f"\nIndex memory: {stats['rerank_dtype']} vectors {stats['matrix_bytes'] / 1e6:.1f} MB, "
+          f"int8 codes {stats['code_bytes'] / 1e6:.1f} MB, centroids {stats['centroid_bytes'] / 1e6:.2f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Production serving configuration for the face processing service.
+
+Run from the face_attendance directory:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported and its face cascade and Gabor bank are warmed in the
+master before workers are forked, so every worker starts hot and shares
+those pages copy-on-write. With GALLERY_SHM_NAME set, the enrolled gallery
+lives in POSIX shared memory, so every worker maps one copy and sees each
+enrollment at once; with more than one worker that is the default. Registration sessions are kept under REGISTRATION_SESSION_DIR,
+so each of their requests can be served by any worker. Send SIGHUP for a graceful reload; each worker is
+recycled after MAX_REQUESTS requests.
+"""
+import multiprocessing
+import os
+import tempfile
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+wsgi_app = 'api-clean:app'
+
+port = os.environ.get('API_PORT', '5000')
+bind = f"{os.environ.get('API_HOST', '0.0.0.0')}:{port}"
+workers = int(os.environ.get('WORKERS', multiprocessing.cpu_count()))
+
+# Settings put in os.environ here are read by the app when the master imports it.
+# Each worker runs ADMISSION_MAX_CONCURRENT pipeline requests at once (its share of the
+# cores, but at least 4 so overlapping requests can be micro-batched) and queues
+# ADMISSION_MAX_QUEUED more. It has threads beyond both, so overflow reaches the app
+# and is rejected at once with 503 and Retry-After instead of waiting in the accept
+# queue, which is kept short for the same reason.
+admission_max_concurrent = int(os.environ.setdefault(
+    'ADMISSION_MAX_CONCURRENT', str(max(4, multiprocessing.cpu_count() // workers))))
+admission_max_queued = int(os.environ.setdefault('ADMISSION_MAX_QUEUED', str(2 * admission_max_concurrent)))
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WORKER_THREADS', admission_max_concurrent + admission_max_queued + 4))
+backlog = int(os.environ.get('BACKLOG', 64))
+
+# With several workers, every worker must see every enrollment, so unless the gallery
+# is persisted (GALLERY_DIR) or an in-process index is asked for, it goes to shared
+# memory. Registration sessions span several requests, which gunicorn may hand to
+# any worker, so they are kept in files.
+if workers > 1:
+    if not os.environ.get('GALLERY_DIR') and os.environ.get('GALLERY_INDEX', 'exact') == 'exact':
+        os.environ.setdefault('GALLERY_SHM_NAME', f"face-gallery-{port}")
+    os.environ.setdefault('REGISTRATION_SESSION_DIR', os.path.join(tempfile.gettempdir(), f"face-registration-sessions-{port}"))
+
+# Import the app (and build its resources) once in the master, then fork
+preload_app = True
+
+# Recycle workers after N requests, staggered so they do not all restart together
+max_requests = int(os.environ.get('MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', max(1, max_requests // 10)))
+
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# OpenCV threads per worker; one worker per core already uses every core
+opencv_threads = int(os.environ.get('OPENCV_THREADS_PER_WORKER', 1))
+
+def on_starting(server):
+    """Start /metrics from zero: drop per-worker snapshots left by a previous run"""
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.startswith('metrics-') and name.endswith('.json'):
+                os.remove(os.path.join(metrics_dir, name))
+
+def worker_exit(server, worker):
+    """Fold the exiting worker's metrics into the aggregate file so recycling loses no counts"""
+    if os.environ.get('METRICS_DIR'):
+        import importlib
+        importlib.import_module('api-clean').metrics.retire()
+
+def on_exit(server):
+    """Free the shared-memory gallery once the whole server has stopped"""
+    shm_name = os.environ.get('GALLERY_SHM_NAME')
+    if shm_name and not os.environ.get('GALLERY_DIR'):
+        from shared_gallery import SharedMemoryFaceGallery
+        SharedMemoryFaceGallery(shm_name).unlink()
+        server.log.info(f"Unlinked shared gallery '{shm_name}'")
+
+def when_ready(server):
+    """Warm shared resources in the master before the first fork"""
+    from resource_registry import registry
+    registry.warm_up()
+    server.log.info(f"Resources warmed before fork: {registry.stats()}")
+    if workers > 1 and not (os.environ.get('GALLERY_DIR') or os.environ.get('GALLERY_SHM_NAME')):
+        server.log.warning(f"Each of the {workers} workers has its own face gallery: /process/identify only "
+                           f"finds templates enrolled through the same worker. Set GALLERY_DIR or GALLERY_SHM_NAME, "
+                           f"or WORKERS=1")
+
+def post_fork(server, worker):
+    """Keep OpenCV from oversubscribing cores across workers"""
+    import cv2
+    cv2.setNumThreads(opencv_threads)
+    server.log.info(f"Worker {worker.pid} started with {opencv_threads} OpenCV thread(s)")
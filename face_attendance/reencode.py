@@ -0,0 +1,242 @@
+"""Bulk re-encoding of stored face templates after a feature extractor change.
+
+Templates from an older extract_face_features are not comparable with new
+ones (a length mismatch scores 0.0), so every employee must be re-encoded.
+This tool does it offline, in chunks, across a process pool:
+
+    # Re-extract from archived enrollment frames: one directory per employee
+    python reencode.py --frames /data/enrollment-frames --output /data/templates-v2
+
+    # Convert exported enhanced_features encodings (JSON lines) to binary templates
+    python reencode.py --encodings encodings.jsonl --output /data/templates-v2
+
+Each frame directory (<frames>/<employee_id>/*.jpg) goes through the same
+RegistrationPipeline as /process/register, so the templates match what the
+service would produce. Encoding lines hold employeeId/employee_id,
+templateId/template_id (defaults to the employee id) and encoding; only
+their format is converted, so --encodings cannot change the features.
+
+Every chunk is written to <output>/templates-NNNNNN.jsonl as records
+{"templateId", "employeeId", "encoding", ...} (encoding is the base64
+binary template), ready to be sent as the "templates" list of
+POST /gallery/templates; failures go to errors-NNNNNN.jsonl. Completed
+chunks are recorded in <output>/checkpoint.json, so running the same
+command again after a crash resumes with the first unfinished chunk.
+"""
+import argparse
+import base64
+import hashlib
+import importlib
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+CHECKPOINT_FILE = 'checkpoint.json'
+
+sys.path.insert(0, SRC_DIR)
+
+from face_template import migrate_legacy_encoding
+
+# Loaded once per worker process by init_worker
+api = None
+
+def init_worker(load_pipeline: bool):
+    """Import the service pipeline without its caches, batching or admission control"""
+    global api
+    logging.disable(logging.CRITICAL)
+    if load_pipeline:
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+        os.environ['MICRO_BATCH_MAX_SIZE'] = '1'
+        os.environ['ADMISSION_MAX_CONCURRENT'] = '0'
+        api = importlib.import_module('api-clean')
+        # One process per core already uses every core
+        api.cv2.setNumThreads(1)
+
+# -- sources ---------------------------------------------------------------
+
+def frame_items(frames_dir: str):
+    """(employee id, frames directory) per employee, in a stable order"""
+    for employee_id in sorted(os.listdir(frames_dir)):
+        directory = os.path.join(frames_dir, employee_id)
+        if os.path.isdir(directory):
+            yield employee_id, directory
+
+def encoding_items(path: str):
+    """Raw lines of an encodings export, read lazily"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+def count_items(args) -> int:
+    if args.frames:
+        return sum(1 for _ in frame_items(args.frames))
+    return sum(1 for _ in encoding_items(args.encodings))
+
+def chunked(items, chunk_size: int):
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+# -- workers ---------------------------------------------------------------
+
+def encode_frames(item, max_frames: int, dtype: str) -> dict:
+    employee_id, directory = item
+    frames = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), 'rb') as f:
+                frames.append(f.read())
+    if not frames:
+        raise ValueError("No frame images")
+
+    pipeline = api.RegistrationPipeline(frames, max_frames=max_frames)
+    template = pipeline.create_template(dtype)
+    return {
+        "templateId": employee_id,
+        "employeeId": employee_id,
+        "encoding": base64.b64encode(template).decode('ascii'),
+        "quality": round(pipeline.best_analysis.quality, 4),
+        "framesAnalyzed": pipeline.frames_analyzed
+    }
+
+def convert_encoding(line: str, dtype: str) -> dict:
+    record = json.loads(line)
+    employee_id = record.get('employeeId') or record.get('employee_id')
+    if not employee_id:
+        raise ValueError("Missing employeeId")
+    template_id = record.get('templateId') or record.get('template_id') or record.get('id') or employee_id
+
+    template = migrate_legacy_encoding(record['encoding'], dtype)
+    return {
+        "templateId": str(template_id),
+        "employeeId": str(employee_id),
+        "encoding": base64.b64encode(template).decode('ascii')
+    }
+
+def process_chunk(index: int, items: list, output: str, mode: str, max_frames: int, dtype: str) -> dict:
+    """Encode one chunk and write its templates and errors files atomically"""
+    records, errors = [], []
+    for item in items:
+        try:
+            if mode == 'frames':
+                records.append(encode_frames(item, max_frames, dtype))
+            else:
+                records.append(convert_encoding(item, dtype))
+        except Exception as e:
+            source = item[0] if mode == 'frames' else item.strip()[:200]
+            errors.append({"source": source, "error": str(e)})
+
+    write_jsonl(os.path.join(output, f"templates-{index:06d}.jsonl"), records)
+    write_jsonl(os.path.join(output, f"errors-{index:06d}.jsonl"), errors)
+    return {"chunk": index, "items": len(items), "templates": len(records), "errors": len(errors)}
+
+def write_jsonl(path: str, records: list):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+    os.replace(tmp, path)
+
+# -- checkpoint ------------------------------------------------------------
+
+def job_signature(args) -> str:
+    """Identifies a run, so a checkpoint is only resumed with the same input and settings"""
+    source = os.path.abspath(args.frames or args.encodings)
+    key = json.dumps([source, args.chunk_size, args.dtype, args.max_frames])
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+def load_checkpoint(path: str, signature: str, restart: bool) -> dict:
+    if restart or not os.path.exists(path):
+        return {"signature": signature, "completed": [], "templates": 0, "errors": 0}
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("signature") != signature:
+        raise SystemExit(f"{path} belongs to a run with different input or settings; "
+                         f"use another --output or pass --restart")
+    return checkpoint
+
+def save_checkpoint(path: str, checkpoint: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+# -- driver ----------------------------------------------------------------
+
+def report(done: int, total: int, templates: int, errors: int, started: float, resumed: int):
+    elapsed = time.perf_counter() - started
+    rate = (done - resumed) / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if rate > 0 else 0.0
+    percent = 100.0 * done / total if total else 100.0
+    print(f"\r{done}/{total} ({percent:5.1f}%)  {templates} templates  {errors} errors  "
+          f"{rate:7.1f}/s  ETA {eta:6.0f} s", end='', flush=True)
+
+def record_chunks(finished, checkpoint: dict, checkpoint_path: str) -> int:
+    """Add finished chunks to the checkpoint; returns the number of items they covered"""
+    items = 0
+    for future in finished:
+        result = future.result()
+        checkpoint["completed"].append(result["chunk"])
+        checkpoint["templates"] += result["templates"]
+        checkpoint["errors"] += result["errors"]
+        items += result["items"]
+    save_checkpoint(checkpoint_path, checkpoint)
+    return items
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encode stored face templates in bulk, resumably")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--frames', help="directory with one sub-directory of enrollment frames per employee")
+    source.add_argument('--encodings', help="JSON lines export of stored encodings")
+    parser.add_argument('--output', required=True, help="directory for template chunks and the checkpoint")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=256, help="items per chunk (and per checkpoint step)")
+    parser.add_argument('--max-frames', type=int, default=5, help="frames scored per employee, as in registration")
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    mode = 'frames' if args.frames else 'encodings'
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint_path = os.path.join(args.output, CHECKPOINT_FILE)
+    checkpoint = load_checkpoint(checkpoint_path, job_signature(args), args.restart)
+    completed = set(checkpoint["completed"])
+
+    total = count_items(args)
+    items = frame_items(args.frames) if args.frames else encoding_items(args.encodings)
+    chunks = ((index, chunk) for index, chunk in enumerate(chunked(items, args.chunk_size)) if index not in completed)
+    resumed = sum(min(args.chunk_size, total - index * args.chunk_size) for index in completed)
+    if completed:
+        print(f"Resuming: {len(completed)} chunks ({resumed} items) already done")
+
+    started = time.perf_counter()
+    done = resumed
+    with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(mode == 'frames',)) as pool:
+        pending = set()
+        for index, chunk in chunks:
+            pending.add(pool.submit(process_chunk, index, chunk, args.output, mode, args.max_frames, args.dtype))
+            # Keep a bounded number of chunks in flight so large inputs are never held in memory
+            if len(pending) >= 2 * args.workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done += record_chunks(finished, checkpoint, checkpoint_path)
+                report(done, total, checkpoint["templates"], checkpoint["errors"], started, resumed)
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            done += record_chunks(finished, checkpoint, checkpoint_path)
+            report(done, total, checkpoint["templates"], checkpoint["errors"], started, resumed)
+
+    print(f"\nDone in {time.perf_counter() - started:.1f} s: {checkpoint['templates']} templates, "
+          f"{checkpoint['errors']} errors in {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# Monotonic deadline of the request being served, None when it has none;
+# copy the context into worker threads to keep it
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('request_deadline', default=None)
+
+class Overloaded(Exception):
+    """The work queue is full, or no slot freed up within the queue timeout"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class DeadlineExceeded(BaseException):
+    """The caller's deadline passed; remaining work for the request is dropped.
+
+    Like asyncio.CancelledError this is a BaseException, so the broad
+    `except Exception` fallbacks in the pipeline do not turn it into an
+    ordinary per-frame failure; it unwinds to the admission wrapper.
+    """
+
+def parse_deadline(headers, received_at: float) -> Optional[float]:
+    """Monotonic deadline from X-Request-Deadline (epoch ms) or X-Request-Timeout (ms budget).
+
+    Raises ValueError for values that are not finite numbers and for a
+    timeout that is not positive; a deadline already in the past is valid.
+    """
+    deadline_ms = headers.get('X-Request-Deadline')
+    if deadline_ms:
+        deadline_ms = float(deadline_ms)
+        if not math.isfinite(deadline_ms):
+            raise ValueError(f"X-Request-Deadline must be finite, got {deadline_ms}")
+        # Absolute deadlines also cover time spent in the listen backlog before arrival
+        return received_at + (deadline_ms / 1000 - time.time())
+    timeout_ms = headers.get('X-Request-Timeout')
+    if timeout_ms:
+        timeout_ms = float(timeout_ms)
+        if not math.isfinite(timeout_ms) or timeout_ms <= 0:
+            raise ValueError(f"X-Request-Timeout must be a positive number of milliseconds, got {timeout_ms}")
+        return received_at + timeout_ms / 1000
+    return None
+
+def remaining_time() -> Optional[float]:
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline(stage: str = ""):
+    """Raise DeadlineExceeded if the current request's deadline has passed"""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        suffix = f" before {stage}" if stage else ""
+        raise DeadlineExceeded(f"Request deadline exceeded{suffix} ({-remaining * 1000:.0f} ms late)")
+
+class AdmissionController:
+    """Bounded work queue in front of the CPU-bound pipeline.
+
+    At most max_concurrent requests run the pipeline at once and at most
+    max_queued wait for a slot. A request arriving with the queue full is
+    rejected immediately with Overloaded instead of holding its frame in
+    memory while latency grows; a queued request gives up when its deadline
+    or queue_timeout passes, whichever is first.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float = 10.0, retry_after: int = 1):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._stats = {"admitted": 0, "rejected_queue_full": 0, "rejected_queue_timeout": 0, "deadline_exceeded": 0}
+
+    @contextmanager
+    def admit(self, deadline: Optional[float] = None):
+        """Hold a pipeline slot for the duration of the block"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._queued >= self.max_queued:
+                    self._stats["rejected_queue_full"] += 1
+                    raise Overloaded(f"Server busy: {self._queued} requests already queued", self.retry_after)
+                self._queued += 1
+            try:
+                timeout = self.queue_timeout
+                if deadline is not None:
+                    timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+                acquired = self._slots.acquire(timeout=timeout)
+            finally:
+                with self._lock:
+                    self._queued -= 1
+            if not acquired:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise DeadlineExceeded("Request deadline exceeded while queued")
+                with self._lock:
+                    self._stats["rejected_queue_timeout"] += 1
+                raise Overloaded(f"Server busy: no worker free within {self.queue_timeout:.0f} s", self.retry_after)
+
+        with self._lock:
+            self._running += 1
+            self._stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._slots.release()
+
+    def record_deadline_exceeded(self):
+        with self._lock:
+            self._stats["deadline_exceeded"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "running": self._running,
+                "queued": self._queued,
+                "max_concurrent": self.max_concurrent,
+                "max_queued": self.max_queued
+            }
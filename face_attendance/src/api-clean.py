@@ -1,11 +1,35 @@
 import logging
 import numpy as np
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 import cv2
 import base64
+import contextvars
+import functools
 from PIL import Image
 import io
-from typing import List, Dict, Any
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple
+from resource_registry import registry, FACE_CASCADE
+from feature_extractor import crop_face, extract_features_batch
+from face_gallery import FaceGallery
+from gallery_store import PersistentFaceGallery
+from face_index import QuantizedFaceGallery
+from shared_gallery import SharedMemoryFaceGallery
+from face_template import DTYPE_CODES, encode_template, load_template_features, migrate_legacy_encoding
+from result_cache import ResultCache
+from metrics import ServiceMetrics, current_endpoint
+from profiling import RequestProfiler, SORT_KEYS
+from micro_batch import MicroBatcher
+from session_store import RegistrationSessionStore
+from frame_filter import NearDuplicateFilter, frame_signature, image_signature, is_jpeg
+from response_codec import BINARY_MIMETYPE, encode_response, numpy_default
+from admission import AdmissionController, DeadlineExceeded, Overloaded, check_deadline, parse_deadline, request_deadline
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,58 +37,340 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-def convert_numpy_types(obj):
-    """Convert numpy types to native Python types for JSON serialization"""
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    else:
-        return obj
+# Per-endpoint stage timings, face counts, image sizes and errors served on /metrics;
+# with METRICS_DIR set, gunicorn workers merge their series through that directory
+METRICS_DIR = os.environ.get('METRICS_DIR')
+metrics = ServiceMetrics(shared_dir=METRICS_DIR)
 
-def base64_to_image(base64_string: str):
-    """Convert base64 string to OpenCV image"""
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default JSON provider that also encodes numpy values and records serialization time"""
+    
+    @staticmethod
+    def default(obj):
+        # Numpy values are converted as the encoder reaches them, without a separate pass
+        if isinstance(obj, (np.generic, np.ndarray)):
+            return numpy_default(obj)
+        return DefaultJSONProvider.default(obj)
+    
+    def dumps(self, obj, **kwargs):
+        with metrics.stage("serialization"):
+            return super().dumps(obj, **kwargs)
+
+app.json = TimedJSONProvider(app)
+
+# Opt-in request profiling: set PROFILE_DIR, then send X-Profile-Request (matching
+# PROFILE_TOKEN if set) or sample 1 in PROFILE_SAMPLE_EVERY requests. With a
+# PROFILE_TOKEN, /admin/profiles also requires it in that header. Without
+# PROFILE_DIR no hooks are registered at all.
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', 0))
+PROFILE_RETENTION = int(os.environ.get('PROFILE_RETENTION', 50))
+profiler = RequestProfiler(PROFILE_DIR, PROFILE_SAMPLE_EVERY, PROFILE_RETENTION, os.environ.get('PROFILE_TOKEN')) if PROFILE_DIR else None
+if profiler is not None:
+    profiler.install(app)
+
+# Enrolled templates used by /process/identify, persisted when GALLERY_DIR is set.
+# GALLERY_SHM_NAME keeps one copy in shared memory for every worker on the node.
+# GALLERY_INDEX=quantized keeps an in-memory int8/IVF index for very large galleries.
+GALLERY_DIR = os.environ.get('GALLERY_DIR')
+GALLERY_SHM_NAME = os.environ.get('GALLERY_SHM_NAME')
+GALLERY_INDEX = os.environ.get('GALLERY_INDEX', 'exact')
+if GALLERY_DIR:
+    if GALLERY_INDEX != 'exact' or GALLERY_SHM_NAME:
+        logger.warning("GALLERY_INDEX and GALLERY_SHM_NAME are not supported with GALLERY_DIR; using exact search")
+    gallery = PersistentFaceGallery(GALLERY_DIR)
+elif GALLERY_SHM_NAME:
+    if GALLERY_INDEX != 'exact':
+        logger.warning(f"GALLERY_INDEX={GALLERY_INDEX} is not supported with GALLERY_SHM_NAME; using exact search")
+    gallery = SharedMemoryFaceGallery(GALLERY_SHM_NAME, os.environ.get('GALLERY_SHM_LOCK'))
+elif GALLERY_INDEX == 'quantized':
+    gallery = QuantizedFaceGallery(
+        nprobe=int(os.environ.get('GALLERY_NPROBE', 8)),
+        rerank=int(os.environ.get('GALLERY_RERANK', 64)),
+        nlist=int(os.environ.get('GALLERY_NLIST', 0)),
+        ivf_min_templates=int(os.environ.get('GALLERY_IVF_MIN_TEMPLATES', 4096)),
+        rerank_dtype=os.environ.get('GALLERY_RERANK_DTYPE', 'float32')
+    )
+else:
+    gallery = FaceGallery()
+
+# Worker pool for batch endpoints; OpenCV releases the GIL while decoding,
+# detecting and filtering, so threads spread one batch across all cores
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+MAX_BATCH_IMAGES = int(os.environ.get('MAX_BATCH_IMAGES', 32))
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='face-batch')
+
+# Micro-batching of concurrent requests: feature extraction and gallery scoring of
+# overlapping requests are run as one vectorized batch of up to MICRO_BATCH_MAX_SIZE
+# items; once requests overlap, a batch waits up to MICRO_BATCH_MAX_WAIT_MS for more
+# to join. A request with nothing to overlap runs on its own thread at once. Requests
+# only overlap in a process that serves several at a time: gunicorn's gthread workers
+# (the gunicorn.conf.py default) or the threaded dev server, never sync workers.
+# MICRO_BATCH_MAX_SIZE=1 disables it.
+MICRO_BATCH_MAX_SIZE = int(os.environ.get('MICRO_BATCH_MAX_SIZE', 16))
+MICRO_BATCH_MAX_WAIT_MS = float(os.environ.get('MICRO_BATCH_MAX_WAIT_MS', 2))
+
+# Bounded work queue in front of the pipeline routes: at most ADMISSION_MAX_CONCURRENT
+# requests run and ADMISSION_MAX_QUEUED wait; beyond that requests get 503 with
+# Retry-After at once (ADMISSION_MAX_CONCURRENT=0 disables the queue). Callers can
+# send X-Request-Deadline (epoch ms) or X-Request-Timeout (ms) to drop stale work.
+# The limits are per process; gunicorn.conf.py gives each worker its share of the cores.
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', os.cpu_count() or 1))
+ADMISSION_MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED', 2 * ADMISSION_MAX_CONCURRENT))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+admission = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUED, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER) if ADMISSION_MAX_CONCURRENT > 0 else None
+
+# Registration frame limits: batch requests score the first frames only, streams
+# and sessions stop early once enough frames pass the quality threshold
+REGISTRATION_MAX_FRAMES = int(os.environ.get('REGISTRATION_MAX_FRAMES', 5))
+STREAM_MAX_FRAMES = int(os.environ.get('STREAM_REGISTRATION_MAX_FRAMES', 300))
+STREAM_TARGET_FRAMES = int(os.environ.get('STREAM_REGISTRATION_TARGET_FRAMES', 5))
+REGISTRATION_SESSION_TTL = float(os.environ.get('REGISTRATION_SESSION_TTL', 300))
+# Sessions hold their best decoded frame until they finish or expire; starting one
+# beyond REGISTRATION_MAX_SESSIONS live sessions gets 503. Without
+# REGISTRATION_SESSION_DIR sessions live in one process's memory, so servers with
+# more than one worker process must set it (gunicorn.conf.py does)
+REGISTRATION_MAX_SESSIONS = int(os.environ.get('REGISTRATION_MAX_SESSIONS', 200))
+REGISTRATION_SESSION_DIR = os.environ.get('REGISTRATION_SESSION_DIR')
+# Registration frames whose 256-bit difference hash differs in fewer than FRAME_DEDUP_DISTANCE
+# bits from an already analyzed frame's are skipped before detection (0 disables it)
+FRAME_DEDUP_DISTANCE = int(os.environ.get('FRAME_DEDUP_DISTANCE', 8))
+
+# Kiosk tracking sessions for /process/checkin: the last face box of a session is
+# searched first in a padded region around it, with a full-frame detection every
+# TRACKING_REDETECT_INTERVAL frames and whenever the face is lost
+TRACKING_SESSION_TTL = float(os.environ.get('TRACKING_SESSION_TTL', 30))
+TRACKING_ROI_PADDING = float(os.environ.get('TRACKING_ROI_PADDING', 0.5))
+TRACKING_REDETECT_INTERVAL = int(os.environ.get('TRACKING_REDETECT_INTERVAL', 30))
+tracking_sessions: Dict[str, Dict[str, Any]] = {}
+tracking_sessions_lock = threading.Lock()
+
+# Detection front end: frames larger than DETECTION_MAX_DIMENSION are scanned on a
+# downscaled copy; face size limits are full-resolution pixels (0 = no maximum)
+DETECTION_MAX_DIMENSION = int(os.environ.get('DETECTION_MAX_DIMENSION', 640))
+DETECTION_MIN_FACE_SIZE = int(os.environ.get('DETECTION_MIN_FACE_SIZE', 30))
+DETECTION_MAX_FACE_SIZE = int(os.environ.get('DETECTION_MAX_FACE_SIZE', 0))
+CASCADE_WINDOW = 24  # Training window of haarcascade_frontalface_default
+
+# JPEGs larger than this are decoded at a reduced DCT scale (0 = always full size)
+DECODE_MAX_DIMENSION = int(os.environ.get('DECODE_MAX_DIMENSION', 1920))
+JPEG_REDUCED_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+# Content types accepted as a raw image body instead of JSON
+RAW_IMAGE_TYPES = ('application/octet-stream',)
+
+# Per-image analysis results keyed by a hash of the encoded bytes, so retried and
+# repeated frames skip decode and detection (RESULT_CACHE_SIZE=0 disables it).
+# RESULT_CACHE_DIR (e.g. under /dev/shm) shares entries between worker processes.
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 1024))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 60))
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')
+# Settings that change the analysis of the same bytes are part of the cache key
+RESULT_CACHE_NAMESPACE = f"v1:{DETECTION_MAX_DIMENSION}:{DETECTION_MIN_FACE_SIZE}:{DETECTION_MAX_FACE_SIZE}:{DECODE_MAX_DIMENSION}"
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_NAMESPACE, RESULT_CACHE_DIR) if RESULT_CACHE_SIZE > 0 else None
+
+def admission_controlled(view):
+    """Run a pipeline route inside the work queue and under the caller's deadline"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            deadline = parse_deadline(request.headers, time.monotonic())
+        except ValueError:
+            return jsonify({"success": False, "error": "Invalid X-Request-Deadline or X-Request-Timeout header"}), 400
+        
+        token = request_deadline.set(deadline)
+        try:
+            check_deadline()
+            if admission is None:
+                return view(*args, **kwargs)
+            with admission.admit(deadline):
+                check_deadline()
+                return view(*args, **kwargs)
+        except Overloaded as e:
+            logger.warning(f"Rejected {request.path}: {e}")
+            response = jsonify({"success": False, "error": str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        except DeadlineExceeded as e:
+            logger.warning(f"Dropped {request.path}: {e}")
+            if admission is not None:
+                admission.record_deadline_exceeded()
+            return jsonify({"success": False, "error": str(e)}), 504
+        finally:
+            request_deadline.reset(token)
+    return wrapper
+
+def decode_base64_payload(base64_string: str) -> bytes:
+    """Decode a base64 image string, with or without a data URL prefix"""
+    # Remove data URL prefix if present
+    if ',' in base64_string:
+        base64_string = base64_string.split(',')[1]
+    
+    with metrics.stage("base64_decode"):
+        return base64.b64decode(base64_string)
+
+def jpeg_reduction_factor(image_bytes: bytes, max_dimension: int) -> int:
+    """Largest JPEG DCT scaling factor (1, 2, 4 or 8) that keeps the image at least max_dimension"""
+    if not max_dimension or image_bytes[:2] != b'\xff\xd8':
+        return 1
+    
     try:
-        # Remove data URL prefix if present
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-        
-        # Decode base64 to bytes
-        image_bytes = base64.b64decode(base64_string)
-        
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(image_bytes))
+        # Only the header is parsed here; pixels are decoded by OpenCV
+        width, height = Image.open(io.BytesIO(image_bytes)).size
+    except Exception:
+        return 1
+    
+    factor = 1
+    while factor < 8 and max(width, height) // (factor * 2) >= max_dimension:
+        factor *= 2
+    return factor
+
+def bytes_to_image(image_bytes: bytes, max_dimension: int = None):
+    """Decode encoded JPEG/PNG bytes straight into an OpenCV BGR image.
+    
+    With max_dimension set, large JPEGs are decoded at 1/2, 1/4 or 1/8 scale
+    by the JPEG decoder itself, never going below max_dimension.
+    """
+    try:
+        if max_dimension is None:
+            max_dimension = DECODE_MAX_DIMENSION
         
-        # Convert to OpenCV format (BGR)
-        opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        # IMREAD_COLOR also maps grayscale and RGBA inputs to 3-channel BGR
+        metrics.observe_image_bytes(len(image_bytes))
+        with metrics.stage("decode"):
+            flags = JPEG_REDUCED_READ_FLAGS[jpeg_reduction_factor(image_bytes, max_dimension)]
+            opencv_image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flags)
+        if opencv_image is None:
+            raise ValueError("Unsupported or corrupt image data")
         
         return opencv_image
+    except Exception as e:
+        logger.error(f"Error decoding image bytes: {e}")
+        return None
+
+def base64_to_image(base64_string: str):
+    """Convert base64 string to OpenCV image"""
+    try:
+        return bytes_to_image(decode_base64_payload(base64_string))
     except Exception as e:
         logger.error(f"Error converting base64 to image: {e}")
         return None
 
+def payload_to_bytes(payload) -> bytes:
+    """Encoded image bytes of a payload given either as raw bytes or as a base64 string"""
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    return decode_base64_payload(payload)
+
+def payload_to_image(payload):
+    """Decode an image payload given either as raw bytes or as a base64 string"""
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes_to_image(payload)
+    return base64_to_image(payload)
+
+def is_raw_image_request() -> bool:
+    """Whether the request body is a bare encoded image (image/jpeg, image/png, ...)"""
+    return request.mimetype.startswith('image/') or request.mimetype in RAW_IMAGE_TYPES
+
+def get_request_data() -> Dict[str, Any]:
+    """Request fields from the JSON body, or from form/query fields for binary uploads"""
+    if is_raw_image_request() or request.files:
+        return {**request.args.to_dict(), **request.form.to_dict()}
+    return request.get_json(silent=True) or {}
+
+def get_uploaded_images(field_names: List[str]) -> List[bytes]:
+    """Raw image bytes sent as the request body or as multipart file parts"""
+    if is_raw_image_request():
+        body = request.get_data()
+        return [body] if body else []
+    
+    images = []
+    for name in field_names:
+        for upload in request.files.getlist(name):
+            images.append(upload.read())
+    return images
+
+def get_request_image(data: Dict[str, Any], field_names: List[str]):
+    """Image payload of a request: uploaded bytes, else the base64 string of a JSON field"""
+    uploads = get_uploaded_images(field_names)
+    if uploads:
+        return uploads[0]
+    
+    for name in field_names:
+        if data.get(name):
+            return data[name]
+    return None
+
+def respond(response_data: Dict[str, Any]) -> Response:
+    """JSON response, or the packed binary format for callers that Accept it"""
+    if request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE]) == BINARY_MIMETYPE:
+        with metrics.stage("serialization"):
+            response = Response(encode_response(response_data), mimetype=BINARY_MIMETYPE)
+    else:
+        response = jsonify(response_data)
+    response.vary.add('Accept')
+    return response
+
 def detect_faces(image):
     """Detect faces in image using OpenCV"""
     try:
         # Convert to grayscale for face detection
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Load pre-trained face detection model
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        # Detect faces
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
+        return detect_faces_in_gray(gray)
+    except Exception as e:
+        logger.error(f"Error in face detection: {e}")
+        return []
+
+def detect_faces_in_gray(gray, min_face_size: int = None, max_face_size: int = None):
+    """Detect faces in an already converted grayscale image.
+    
+    Large frames are scanned on a copy bounded to DETECTION_MAX_DIMENSION and
+    the boxes are mapped back to full-resolution coordinates, so quality
+    metrics and feature crops still use the original pixels. Face sizes are
+    given in full-resolution pixels.
+    """
+    try:
+        min_face_size = min_face_size or DETECTION_MIN_FACE_SIZE
+        max_face_size = max_face_size or DETECTION_MAX_FACE_SIZE
+        
+        # Scan a bounded-resolution copy of large frames
+        height, width = gray.shape[:2]
+        scale = 1.0
+        if DETECTION_MAX_DIMENSION and max(height, width) > DETECTION_MAX_DIMENSION:
+            scale = DETECTION_MAX_DIMENSION / max(height, width)
+            detection_image = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            detection_image = gray
+        
+        # Skip scales where no face can appear given the camera geometry
+        min_size = max(CASCADE_WINDOW, int(round(min_face_size * scale)))
+        max_size = int(round(max_face_size * scale)) if max_face_size else 0
+        
+        # Borrow the pre-loaded face detection model from the registry
+        with registry.acquire(FACE_CASCADE) as face_cascade:
+            # Detect faces
+            faces = face_cascade.detectMultiScale(
+                detection_image,
+                scaleFactor=1.1,
+                minNeighbors=5,
+                minSize=(min_size, min_size),
+                maxSize=(max_size, max_size)
+            )
+        
+        if scale != 1.0 and len(faces) > 0:
+            # Map boxes back to full resolution
+            faces = np.round(np.asarray(faces, dtype=np.float64) / scale).astype(np.int32)
+            faces[:, 0] = np.clip(faces[:, 0], 0, width - 1)
+            faces[:, 1] = np.clip(faces[:, 1], 0, height - 1)
+            faces[:, 2] = np.minimum(faces[:, 2], width - faces[:, 0])
+            faces[:, 3] = np.minimum(faces[:, 3], height - faces[:, 1])
         
         logger.info(f"Detected {len(faces)} faces")
         return faces
@@ -72,157 +378,289 @@ def detect_faces(image):
         logger.error(f"Error in face detection: {e}")
         return []
 
-def analyze_enhanced_face_quality(image_b64: str) -> float:
-    """Analyze face quality with enhanced metrics"""
+def detect_faces_near(gray, face):
+    """Detect faces only in a padded region around a previous (x, y, w, h) box.
+    
+    The search is limited to faces between half and twice the previous size,
+    and the boxes are returned in full-frame coordinates.
+    """
+    x, y, w, h = [int(v) for v in face]
+    height, width = gray.shape[:2]
+    pad_x = int(w * TRACKING_ROI_PADDING)
+    pad_y = int(h * TRACKING_ROI_PADDING)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    if x1 - x0 < CASCADE_WINDOW or y1 - y0 < CASCADE_WINDOW:
+        return []
+    
+    size = max(w, h)
+    faces = detect_faces_in_gray(gray[y0:y1, x0:x1], min_face_size=max(1, size // 2), max_face_size=size * 2)
+    if len(faces) == 0:
+        return []
+    
+    faces = np.asarray(faces, dtype=np.int32).copy()
+    faces[:, 0] += x0
+    faces[:, 1] += y0
+    return faces
+
+def get_largest_face(faces):
+    """Return the (x, y, w, h) box with the largest area"""
+    return max(faces, key=lambda x: x[2] * x[3])
+
+def compute_face_quality(image_shape, gray, face) -> Dict[str, float]:
+    """Compute quality components for one face box of an already decoded image"""
+    x, y, w, h = face
+    
+    # Extract face region
+    face_region = gray[y:y+h, x:x+w]
+    
+    # 1. Size score (larger faces are better)
+    size_score = min(1.0, (w * h) / (100 * 100))  # Normalize to 100x100
+    
+    # 2. Position score (center faces are better)
+    img_center_x, img_center_y = image_shape[1] // 2, image_shape[0] // 2
+    face_center_x, face_center_y = x + w // 2, y + h // 2
+    
+    distance_from_center = np.sqrt((face_center_x - img_center_x)**2 + (face_center_y - img_center_y)**2)
+    max_distance = np.sqrt((image_shape[1] // 2)**2 + (image_shape[0] // 2)**2)
+    position_score = max(0.0, 1.0 - (distance_from_center / max_distance))
+    
+    # 3. Sharpness score using Laplacian variance
+    laplacian_var = cv2.Laplacian(face_region, cv2.CV_64F).var()
+    sharpness_score = min(1.0, laplacian_var / 500.0)  # Normalize to typical range
+    
+    # 4. Contrast score
+    contrast_score = np.std(face_region) / 128.0  # Normalize to 0-1
+    
+    # Calculate overall quality as average
+    overall_quality = np.mean([size_score, position_score, sharpness_score, min(1.0, contrast_score)])
+    
+    logger.info(f"Quality scores - Size: {size_score:.3f}, Position: {position_score:.3f}, Sharpness: {sharpness_score:.3f}, Contrast: {contrast_score:.3f}, Overall: {overall_quality:.3f}")
+    
+    return {
+        "size": float(size_score),
+        "position": float(position_score),
+        "sharpness": float(sharpness_score),
+        "contrast": float(contrast_score),
+        "overall": float(overall_quality)
+    }
+
+def compute_face_features(image, face) -> List[float]:
+    """Extract recognition features for one face box of an already decoded image"""
+    x, y, w, h = face
+    
+    # Resize the face region to the standard crop and run the batch extractor on it
+    face_crop = crop_face(image, face)
+    features = extract_features_batch(face_crop[np.newaxis], [w / (h + 1e-8)])[0]
+    
+    logger.info(f"Extracted {len(features)} real features from face")
+    return features.tolist()
+
+def extract_features_for_faces(items: List[tuple]) -> List[Any]:
+    """Features for a batch of (image, face box) pairs in one vectorized pass.
+    
+    A face that cannot be cropped gets its exception as the result, so it
+    fails alone instead of failing the whole batch.
+    """
+    results: List[Any] = [None] * len(items)
+    face_crops, aspect_ratios, rows = [], [], []
+    for i, (image, face) in enumerate(items):
+        try:
+            face_crops.append(crop_face(image, face))
+            aspect_ratios.append(face[2] / (face[3] + 1e-8))
+            rows.append(i)
+        except Exception as e:
+            results[i] = e
+    
+    if rows:
+        features = extract_features_batch(np.stack(face_crops), aspect_ratios)
+        for i, row in zip(rows, features.tolist()):
+            results[i] = row
+    logger.info(f"Extracted features for a batch of {len(rows)} faces")
+    return results
+
+def search_gallery_batch(items: List[tuple]) -> List[List[Dict[str, Any]]]:
+    """Top-k gallery matches for a batch of (features, k) probes in one matrix product"""
+    probes = np.asarray([features for features, _ in items], dtype=np.float32)
+    max_k = max(k for _, k in items)
+    return [matches[:k] for matches, (_, k) in zip(gallery.search_batch(probes, max_k), items)]
+
+if MICRO_BATCH_MAX_SIZE > 1:
+    feature_batcher = MicroBatcher(extract_features_for_faces, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS, "features",
+                                   on_batch=lambda size, waits: metrics.observe_batch("features", size, waits))
+    search_batcher = MicroBatcher(search_gallery_batch, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS, "gallery_search",
+                                  on_batch=lambda size, waits: metrics.observe_batch("gallery_search", size, waits))
+else:
+    feature_batcher = search_batcher = None
+
+def extract_face_features_batched(image, face) -> List[float]:
+    """Features of one face, coalesced with concurrent requests when micro-batching is on"""
+    if feature_batcher is None:
+        return compute_face_features(image, face)
+    return feature_batcher.submit((image, face))
+
+def search_gallery(features: List[float], k: int) -> List[Dict[str, Any]]:
+    """Top-k gallery matches of one probe, coalesced with concurrent requests when micro-batching is on"""
+    if search_batcher is None:
+        return gallery.search(features, k)
+    return search_batcher.submit((features, k))
+
+class FaceAnalysis:
+    """Per-request face analysis that decodes and detects once.
+    
+    Quality, features and face count are all derived from the same decoded
+    image, grayscale conversion and face boxes, and are computed lazily so a
+    handler only pays for what it reads.
+    """
+    
+    def __init__(self, image, previous_face=None):
+        self.image = image
+        self.decoded = image is not None
+        self.gray = None
+        self.faces = []
+        self.tracked = False
+        self._quality = None
+        self._features = None
+        self._image_bytes = None
+        
+        if image is not None:
+            try:
+                with metrics.stage("detect"):
+                    self.gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                    if previous_face is not None:
+                        # Search around the last known face first, full frame if it is lost
+                        self.faces = detect_faces_near(self.gray, previous_face)
+                        self.tracked = len(self.faces) > 0
+                    if not self.tracked:
+                        self.faces = detect_faces_in_gray(self.gray)
+                metrics.observe_faces(len(self.faces))
+            except Exception as e:
+                logger.error(f"Error preparing face analysis: {e}")
+                self.gray = None
+                self.faces = []
+    
+    @classmethod
+    def from_base64(cls, image_b64: str) -> 'FaceAnalysis':
+        """Decode a base64 image once and analyze it"""
+        return cls(base64_to_image(image_b64))
+    
+    @classmethod
+    def from_payload(cls, payload) -> 'FaceAnalysis':
+        """Decode raw image bytes or a base64 string once and analyze it"""
+        return cls(payload_to_image(payload))
+    
+    @classmethod
+    def from_summary(cls, summary: Dict[str, Any], image_bytes: bytes = None) -> 'FaceAnalysis':
+        """Rebuild an analysis from a cached summary without decoding the image.
+        
+        If the summary has no features, they are extracted from image_bytes on
+        first access, reusing the cached face box.
+        """
+        analysis = cls(None)
+        analysis.decoded = True
+        analysis.faces = [tuple(face) for face in summary["faces"]]
+        analysis._quality = summary["quality_components"]
+        analysis._features = summary["features"]
+        analysis._image_bytes = image_bytes
+        return analysis
+    
+    def summary(self, include_features: bool = True) -> Dict[str, Any]:
+        """JSON-serializable faces, quality and (optionally) features for the result cache"""
+        return {
+            "faces": [[int(v) for v in face] for face in self.faces],
+            "quality_components": self.quality_components,
+            "features": self.features if include_features else self._features
+        }
+    
+    @property
+    def faces_count(self) -> int:
+        return len(self.faces)
+    
+    @property
+    def largest_face(self):
+        if len(self.faces) == 0:
+            return None
+        return get_largest_face(self.faces)
+    
+    @property
+    def quality_components(self) -> Dict[str, float]:
+        """Quality components of the largest face, empty if there is none"""
+        if self._quality is None:
+            self._quality = {}
+            if self.largest_face is None:
+                if self.image is not None:
+                    logger.warning("No faces detected for quality analysis")
+            else:
+                try:
+                    with metrics.stage("quality"):
+                        self._quality = compute_face_quality(self.image.shape, self.gray, self.largest_face)
+                except Exception as e:
+                    logger.error(f"Error in enhanced face quality analysis: {e}")
+        return self._quality
+    
+    @property
+    def quality(self) -> float:
+        return self.quality_components.get("overall", 0.0)
+    
+    @property
+    def features(self) -> List[float]:
+        if self._features is None and self._image_bytes is not None and self.largest_face is not None:
+            # Restored from a summary without features: decode only now
+            self.image = bytes_to_image(self._image_bytes)
+            self._image_bytes = None
+        if self._features is None:
+            self._features = []
+            if self.largest_face is None:
+                if self.image is not None:
+                    logger.warning("No faces detected for feature extraction")
+            else:
+                try:
+                    with metrics.stage("features"):
+                        self._features = extract_face_features_batched(self.image, self.largest_face)
+                except Exception as e:
+                    logger.error(f"Error in face feature extraction: {e}")
+        return self._features
+
+def analyze_image_payload(payload, previous_face=None) -> FaceAnalysis:
+    """FaceAnalysis of one image payload, served from the result cache when possible.
+    
+    previous_face enables the tracking search around a known face box.
+    """
+    check_deadline("decode")
+    if result_cache is None:
+        image = payload_to_image(payload)
+        check_deadline("detection")
+        return FaceAnalysis(image, previous_face)
+    
     try:
-        image = base64_to_image(image_b64)
-        if image is None:
-            return 0.0
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces
-        faces = detect_faces(image)
-        if len(faces) == 0:
-            logger.warning("No faces detected for quality analysis")
-            return 0.0
-        
-        # Get the largest face
-        largest_face = max(faces, key=lambda x: x[2] * x[3])
-        x, y, w, h = largest_face
-        
-        # Extract face region
-        face_region = gray[y:y+h, x:x+w]
-        
-        # Quality metrics
-        quality_scores = []
-        
-        # 1. Size score (larger faces are better)
-        size_score = min(1.0, (w * h) / (100 * 100))  # Normalize to 100x100
-        quality_scores.append(size_score)
-        
-        # 2. Position score (center faces are better)
-        img_center_x, img_center_y = image.shape[1] // 2, image.shape[0] // 2
-        face_center_x, face_center_y = x + w // 2, y + h // 2
-        
-        distance_from_center = np.sqrt((face_center_x - img_center_x)**2 + (face_center_y - img_center_y)**2)
-        max_distance = np.sqrt((image.shape[1] // 2)**2 + (image.shape[0] // 2)**2)
-        position_score = max(0.0, 1.0 - (distance_from_center / max_distance))
-        quality_scores.append(position_score)
-        
-        # 3. Sharpness score using Laplacian variance
-        laplacian_var = cv2.Laplacian(face_region, cv2.CV_64F).var()
-        sharpness_score = min(1.0, laplacian_var / 500.0)  # Normalize to typical range
-        quality_scores.append(sharpness_score)
-        
-        # 4. Contrast score
-        contrast_score = np.std(face_region) / 128.0  # Normalize to 0-1
-        quality_scores.append(min(1.0, contrast_score))
-        
-        # Calculate overall quality as average
-        overall_quality = np.mean(quality_scores)
-        
-        logger.info(f"Quality scores - Size: {size_score:.3f}, Position: {position_score:.3f}, Sharpness: {sharpness_score:.3f}, Contrast: {contrast_score:.3f}, Overall: {overall_quality:.3f}")
-        
-        return float(overall_quality)
-        
+        image_bytes = payload_to_bytes(payload)
     except Exception as e:
-        logger.error(f"Error in enhanced face quality analysis: {e}")
-        return 0.0
+        logger.error(f"Error converting base64 to image: {e}")
+        return FaceAnalysis(None)
+    
+    key = result_cache.key(image_bytes)
+    summary = result_cache.get(key)
+    if summary is not None:
+        return FaceAnalysis.from_summary(summary, image_bytes)
+    
+    image = bytes_to_image(image_bytes)
+    check_deadline("detection")
+    analysis = FaceAnalysis(image, previous_face)
+    # Region-of-interest results may miss faces elsewhere in the frame, so only
+    # full-frame analyses are shared through the cache
+    if analysis.decoded and not analysis.tracked:
+        # Frames that fail the quality gate usually never need features, so those
+        # are cached without them and extracted on demand if a caller asks
+        result_cache.put(key, analysis.summary(include_features=analysis.quality >= 0.3))
+    return analysis
+
+def analyze_enhanced_face_quality(image_b64: str) -> float:
+    """Analyze face quality with enhanced metrics"""
+    return FaceAnalysis.from_base64(image_b64).quality
 
 def extract_face_features(image_b64: str) -> List[float]:
     """Extract real face features for recognition"""
-    try:
-        image = base64_to_image(image_b64)
-        if image is None:
-            return []
-        
-        # Detect faces
-        faces = detect_faces(image)
-        if len(faces) == 0:
-            logger.warning("No faces detected for feature extraction")
-            return []
-        
-        # Get the largest face
-        largest_face = max(faces, key=lambda x: x[2] * x[3])
-        x, y, w, h = largest_face
-        
-        # Extract face region
-        face_region = image[y:y+h, x:x+w]
-        
-        # Resize to standard size for consistent features
-        face_region = cv2.resize(face_region, (128, 128))
-        
-        # Convert to grayscale
-        gray_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
-        
-        features = []
-        
-        # 1. Histogram features (more detailed)
-        hist = cv2.calcHist([gray_face], [0], None, [32], [0, 256])
-        hist_normalized = hist.flatten() / (hist.sum() + 1e-8)
-        features.extend(hist_normalized.tolist())
-        
-        # 2. Edge density features (multiple scales)
-        for scale in [1, 2, 4]:
-            resized = cv2.resize(gray_face, (128//scale, 128//scale))
-            edges = cv2.Canny(resized, 50, 150)
-            edge_density = np.sum(edges > 0) / (resized.shape[0] * resized.shape[1])
-            features.append(float(edge_density))
-        
-        # 3. Texture features using Gabor filters
-        angles = [0, 45, 90, 135]
-        for angle in angles:
-            kernel = cv2.getGaborKernel((21, 21), 8.0, np.radians(angle), 10.0, 0.5, 0, ktype=cv2.CV_32F)
-            filtered = cv2.filter2D(gray_face, cv2.CV_8UC3, kernel)
-            texture_score = np.mean(filtered) / 255.0
-            features.append(float(texture_score))
-        
-        # 4. Local Binary Pattern approximation
-        lbp_features = []
-        for i in range(0, 128, 16):
-            for j in range(0, 128, 16):
-                block = gray_face[i:i+16, j:j+16]
-                if block.shape == (16, 16):
-                    # Simple texture measure
-                    grad_x = cv2.Sobel(block, cv2.CV_64F, 1, 0, ksize=3)
-                    grad_y = cv2.Sobel(block, cv2.CV_64F, 0, 1, ksize=3)
-                    gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
-                    lbp_features.append(float(np.mean(gradient_magnitude) / 255.0))
-        
-        features.extend(lbp_features[:16])  # Limit to 16 features
-        
-        # 5. Brightness and contrast features
-        brightness = np.mean(gray_face) / 255.0
-        contrast = np.std(gray_face) / 255.0
-        features.extend([float(brightness), float(contrast)])
-        
-        # 6. Shape features
-        # Calculate face aspect ratio and position
-        aspect_ratio = w / (h + 1e-8)
-        features.append(float(aspect_ratio))
-        
-        # 7. Color features (from original color image)
-        face_color = face_region
-        # Convert to different color spaces
-        hsv = cv2.cvtColor(face_color, cv2.COLOR_BGR2HSV)
-        lab = cv2.cvtColor(face_color, cv2.COLOR_BGR2LAB)
-        
-        # HSV features
-        h_mean, s_mean, v_mean = np.mean(hsv, axis=(0, 1))
-        features.extend([float(h_mean/179.0), float(s_mean/255.0), float(v_mean/255.0)])
-        
-        # LAB features
-        l_mean, a_mean, b_mean = np.mean(lab, axis=(0, 1))
-        features.extend([float(l_mean/255.0), float(a_mean/255.0), float(b_mean/255.0)])
-        
-        logger.info(f"Extracted {len(features)} real features from face")
-        return features
-        
-    except Exception as e:
-        logger.error(f"Error in face feature extraction: {e}")
-        return []
+    return FaceAnalysis.from_base64(image_b64).features
 
 def calculate_face_similarity(features1: List[float], features2: List[float]) -> float:
     """Calculate similarity between two face feature vectors"""
@@ -252,51 +690,151 @@ def calculate_face_similarity(features1: List[float], features2: List[float]) ->
         logger.error(f"Error calculating face similarity: {e}")
         return 0.0
 
-def calculate_overall_quality(video_frames: List[str]) -> float:
-    """Calculate overall quality from multiple video frames"""
-    try:
-        if not video_frames:
+class RegistrationPipeline:
+    """Registration pipeline that decodes, detects and scores every frame exactly once.
+    
+    Frames can be given up front or fed one at a time with add_frame(). Each
+    frame's box and quality components are recorded, while only the best
+    frame's FaceAnalysis (image, gray, boxes) is kept for feature extraction.
+    The pipeline stops analyzing once max_frames have been scored or, when
+    target_good_frames is set, once that many frames reach quality_threshold.
+    With dedup_distance set, frames nearly identical to an analyzed one are
+    skipped before decoding and do not count towards max_frames.
+    """
+    
+    MAX_FRAMES = 5  # Use first 5 frames
+    
+    def __init__(self, video_frames: List = (), max_frames: int = MAX_FRAMES,
+                 target_good_frames: int = None, quality_threshold: float = 0.3,
+                 dedup_distance: int = FRAME_DEDUP_DISTANCE):
+        self.max_frames = max_frames
+        self.target_good_frames = target_good_frames
+        self.quality_threshold = quality_threshold
+        self.frame_filter = NearDuplicateFilter(dedup_distance) if dedup_distance > 0 else None
+        self.frame_count = 0
+        self.frames: List[Dict[str, Any]] = []
+        self.good_frames = 0
+        self.best_analysis = None
+        
+        for frame in video_frames:
+            self.add_frame(frame)
+    
+    @property
+    def is_complete(self) -> bool:
+        """Whether further frames would be ignored"""
+        if len(self.frames) >= self.max_frames:
+            return True
+        return self.target_good_frames is not None and self.good_frames >= self.target_good_frames
+    
+    def add_frame(self, frame):
+        """Score one frame (raw bytes or base64); returns its analysis, or None if complete or skipped"""
+        self.frame_count += 1
+        if self.is_complete:
+            return None
+        
+        check_deadline("frame analysis")
+        image = None
+        if self.frame_filter is not None:
+            try:
+                frame = payload_to_bytes(frame)
+            except Exception:
+                # Not an image payload; FaceAnalysis scores it as an undecodable frame
+                signature = None
+            else:
+                with metrics.stage("dedup"):
+                    if is_jpeg(frame):
+                        signature = frame_signature(frame)
+                    else:
+                        # No reduced decode for other formats: decode once and analyze that image
+                        image = bytes_to_image(frame)
+                        signature = image_signature(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)) if image is not None else None
+            if self.frame_filter.is_duplicate(signature):
+                return None
+        
+        analysis = FaceAnalysis(image) if image is not None else FaceAnalysis.from_payload(frame)
+        quality = analysis.quality
+        self.frames.append({
+            "face": analysis.largest_face,
+            "faces_count": analysis.faces_count,
+            "quality_components": analysis.quality_components
+        })
+        logger.info(f"Frame {len(self.frames)} quality: {quality:.3f}")
+        
+        if quality >= self.quality_threshold:
+            self.good_frames += 1
+        
+        # Keep only the best frame's decoded image around
+        best_quality = self.best_analysis.quality if self.best_analysis is not None else 0
+        if quality > best_quality:
+            self.best_analysis = analysis
+        
+        return analysis
+    
+    @property
+    def frames_analyzed(self) -> int:
+        return len(self.frames)
+    
+    @property
+    def frames_skipped(self) -> int:
+        """Frames skipped as near-duplicates of an analyzed frame"""
+        return self.frame_filter.skipped if self.frame_filter is not None else 0
+    
+    def to_state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """JSON-serializable metadata and arrays that from_state() rebuilds this pipeline from"""
+        meta = {
+            "max_frames": self.max_frames,
+            "target_good_frames": self.target_good_frames,
+            "quality_threshold": self.quality_threshold,
+            "dedup_distance": self.frame_filter.max_distance if self.frame_filter is not None else 0,
+            "frames_skipped": self.frames_skipped,
+            "frame_count": self.frame_count,
+            "frames": self.frames,
+            "good_frames": self.good_frames,
+            "best": None
+        }
+        arrays = {}
+        if self.frame_filter is not None:
+            arrays["dedup_kept"] = self.frame_filter.kept
+        if self.best_analysis is not None:
+            meta["best"] = self.best_analysis.summary(include_features=False)
+            if self.best_analysis.image is not None:
+                arrays["best_image"] = self.best_analysis.image
+        return meta, arrays
+    
+    @classmethod
+    def from_state(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'RegistrationPipeline':
+        """Rebuild a pipeline saved with to_state(), including its best frame's image"""
+        pipeline = cls(max_frames=meta["max_frames"], target_good_frames=meta["target_good_frames"],
+                       quality_threshold=meta["quality_threshold"], dedup_distance=0)
+        if meta["dedup_distance"] > 0:
+            pipeline.frame_filter = NearDuplicateFilter(meta["dedup_distance"], kept=arrays.get("dedup_kept"),
+                                                        skipped=meta["frames_skipped"])
+        pipeline.frame_count = meta["frame_count"]
+        pipeline.frames = meta["frames"]
+        pipeline.good_frames = meta["good_frames"]
+        if meta["best"] is not None:
+            pipeline.best_analysis = FaceAnalysis.from_summary(meta["best"])
+            pipeline.best_analysis.image = arrays.get("best_image")
+        return pipeline
+    
+    @property
+    def overall_quality(self) -> float:
+        if not self.frames:
             return 0.0
         
-        qualities = []
-        for i, frame in enumerate(video_frames[:5]):  # Use first 5 frames
-            quality = analyze_enhanced_face_quality(frame)
-            qualities.append(quality)
-            logger.info(f"Frame {i+1} quality: {quality:.3f}")
-        
-        overall_quality = np.mean(qualities)
-        logger.info(f"Overall video quality: {overall_quality:.3f}")
-        
+        overall_quality = np.mean([frame["quality_components"].get("overall", 0.0) for frame in self.frames])
         return float(overall_quality)
-        
-    except Exception as e:
-        logger.error(f"Error calculating overall quality: {e}")
-        return 0.0
-
-def create_enhanced_face_encoding(employee_id: str, employee_name: str, video_frames: List[str]) -> str:
-    """Create enhanced face encoding from video frames with real features"""
-    try:
-        if not video_frames:
-            raise ValueError("No video frames provided")
-        
-        # Calculate overall quality
-        overall_quality = calculate_overall_quality(video_frames)
-        
-        # Use the best frame for encoding (highest quality)
-        best_frame = None
-        best_quality = 0
-        
-        for i, frame in enumerate(video_frames[:5]):  # Check first 5 frames
-            quality = analyze_enhanced_face_quality(frame)
-            if quality > best_quality:
-                best_quality = quality
-                best_frame = frame
-        
-        if not best_frame:
+    
+    def create_encoding(self, employee_id: str, employee_name: str) -> str:
+        """Create enhanced face encoding from the best analyzed frame"""
+        best_analysis = self.best_analysis
+        if best_analysis is None:
             raise ValueError("No suitable frame found for encoding")
         
-        # Extract real features from best frame
-        real_features = extract_face_features(best_frame)
+        best_quality = best_analysis.quality
+        
+        # Extract real features from best frame, reusing its decoded image and face box
+        real_features = best_analysis.features
         
         if len(real_features) == 0:
             raise ValueError("Failed to extract features from best frame")
@@ -306,7 +844,7 @@ def create_enhanced_face_encoding(employee_id: str, employee_name: str, video_fr
             "employee_id": employee_id,
             "employee_name": employee_name,
             "quality": best_quality,
-            "frame_count": len(video_frames),
+            "frame_count": self.frame_count,
             "features": real_features,  # Store real features as array
             "feature_count": len(real_features),
             "timestamp": "2025-08-17T06:53:41Z",
@@ -314,7 +852,6 @@ def create_enhanced_face_encoding(employee_id: str, employee_name: str, video_fr
         }
         
         # Convert to JSON string first, then base64
-        import json
         encoding_json = json.dumps(encoding_data, separators=(',', ':'))  # Compact JSON
         encoding_b64 = base64.b64encode(encoding_json.encode('utf-8')).decode('utf-8')
         
@@ -323,11 +860,100 @@ def create_enhanced_face_encoding(employee_id: str, employee_name: str, video_fr
         logger.info(f"Base64 encoding length: {len(encoding_b64)} characters")
         
         return encoding_b64
+    
+    def create_template(self, dtype: str = 'float32') -> bytes:
+        """Create a binary face template from the best analyzed frame"""
+        best_analysis = self.best_analysis
+        if best_analysis is None or len(best_analysis.features) == 0:
+            raise ValueError("No suitable frame found for encoding")
+        
+        return encode_template(best_analysis.features, best_analysis.quality, dtype)
+
+def calculate_overall_quality(video_frames: List[str]) -> float:
+    """Calculate overall quality from multiple video frames"""
+    try:
+        overall_quality = RegistrationPipeline(video_frames).overall_quality
+        logger.info(f"Overall video quality: {overall_quality:.3f}")
+        
+        return overall_quality
+        
+    except Exception as e:
+        logger.error(f"Error calculating overall quality: {e}")
+        return 0.0
+
+def create_enhanced_face_encoding(employee_id: str, employee_name: str, video_frames: List[str]) -> str:
+    """Create enhanced face encoding from video frames with real features"""
+    try:
+        if not video_frames:
+            raise ValueError("No video frames provided")
+        
+        return RegistrationPipeline(video_frames).create_encoding(employee_id, employee_name)
         
     except Exception as e:
         logger.error(f"Error creating enhanced face encoding: {e}")
         raise
 
+def parse_face_encoding(encoding_b64: str) -> np.ndarray:
+    """Extract the feature vector from a stored encoding (binary template or enhanced_features JSON)"""
+    features, _ = load_template_features(encoding_b64)
+    return features
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.endpoint_token = current_endpoint.set(request.url_rule.rule if request.url_rule else "unmatched")
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe_request(current_endpoint.get(), response.status_code, time.perf_counter() - started)
+    return response
+
+@app.teardown_request
+def reset_request_endpoint(exc):
+    token = g.pop('endpoint_token', None)
+    if token is not None:
+        current_endpoint.reset(token)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request and pipeline stage metrics in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_request_profiles():
+    """Captured request profiles, newest first"""
+    if profiler is None:
+        return jsonify({"success": False, "error": "Request profiling is disabled (set PROFILE_DIR)"}), 404
+    if not profiler.authorized():
+        return jsonify({"success": False, "error": f"Send PROFILE_TOKEN in {profiler.HEADER}"}), 403
+    return jsonify({"success": True, "profiles": profiler.list_profiles()})
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_request_profile(profile_id):
+    """Download a captured profile (.prof for pstats/snakeviz), or ?format=text for a summary"""
+    if profiler is None:
+        return jsonify({"success": False, "error": "Request profiling is disabled (set PROFILE_DIR)"}), 404
+    if not profiler.authorized():
+        return jsonify({"success": False, "error": f"Send PROFILE_TOKEN in {profiler.HEADER}"}), 403
+    
+    path = profiler.path(profile_id)
+    if path is None or not os.path.exists(path):
+        return jsonify({"success": False, "error": "Profile not found"}), 404
+    
+    if request.args.get('format') == 'text':
+        try:
+            limit = int(request.args.get('limit', 40))
+        except ValueError:
+            return jsonify({"success": False, "error": "limit must be an integer"}), 400
+        sort = request.args.get('sort', 'cumulative')
+        if limit < 1 or sort not in SORT_KEYS:
+            return jsonify({"success": False, "error": f"limit must be positive and sort one of: {', '.join(sorted(SORT_KEYS))}"}), 400
+        summary = profiler.summary(profile_id, limit, sort)
+        return Response(summary, mimetype='text/plain')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=os.path.basename(path))
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -335,23 +961,93 @@ def health_check():
         "status": "healthy",
         "service": "Face Recognition Processing Service",
         "version": "2.0.0",
-        "description": "Enhanced face processing tool for employee management system"
+        "description": "Enhanced face processing tool for employee management system",
+        "resources": registry.stats(),
+        "gallery": gallery.stats(),
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "admission": admission.stats() if admission is not None else None,
+        "micro_batching": {
+            "features": feature_batcher.stats(),
+            "gallery_search": search_batcher.stats()
+        } if feature_batcher is not None else None
     })
 
+ENCODING_FORMATS = ('json', 'binary')
+
+def registration_output_options(options: Dict[str, Any]) -> Tuple[str, str]:
+    """The encodingFormat and templateDtype of a registration request.
+    
+    Raises ValueError naming the allowed values, so routes can reject a bad
+    option before any frame is decoded.
+    """
+    encoding_format = options.get('encodingFormat') or options.get('encoding_format') or 'json'
+    template_dtype = options.get('templateDtype') or options.get('template_dtype') or 'float32'
+    if encoding_format not in ENCODING_FORMATS:
+        raise ValueError(f"encodingFormat must be one of: {', '.join(ENCODING_FORMATS)}")
+    if not isinstance(template_dtype, str) or template_dtype not in DTYPE_CODES:
+        raise ValueError(f"templateDtype must be one of: {', '.join(DTYPE_CODES)}")
+    return encoding_format, template_dtype
+
+def complete_registration(pipeline: RegistrationPipeline, employee_id: str, employee_name: str, template_id: str,
+                          options: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Create the encoding from an analyzed pipeline, enroll it and build the response.
+    
+    The response always carries the binary template (base64). "encoding" stays
+    the legacy enhanced_features JSON unless encodingFormat is "binary".
+    """
+    encoding_format, template_dtype = registration_output_options(options or {})
+    
+    template = base64.b64encode(pipeline.create_template(template_dtype)).decode('utf-8')
+    
+    # Create enhanced face encoding
+    if encoding_format == 'binary':
+        encoding = template
+    else:
+        encoding = pipeline.create_encoding(employee_id, employee_name)
+    
+    # Calculate quality metrics
+    overall_quality = pipeline.overall_quality
+    logger.info(f"Overall video quality: {overall_quality:.3f}")
+    
+    # Enroll the new template for in-process identification
+    gallery.add(template_id, employee_id, pipeline.best_analysis.features)
+    
+    # Prepare response
+    response_data = {
+        "success": True,
+        "encoding": encoding,
+        "encoding_format": encoding_format,
+        "template": template,
+        "quality_score": overall_quality,
+        "debug_info": {
+            "service_version": "2.0.0",
+            "frames_processed": pipeline.frame_count,
+            "frames_analyzed": pipeline.frames_analyzed,
+            "frames_skipped_duplicate": pipeline.frames_skipped,
+            "good_frames": pipeline.good_frames,
+            "quality_threshold_passed": overall_quality >= 0.3,
+            "processing_timestamp": "2025-08-17T06:53:41Z"
+        }
+    }
+    
+    return response_data
+
 @app.route('/process/register', methods=['POST'])
+@admission_controlled
 def process_face_registration():
     """Process face registration from video frames"""
     try:
         logger.info("Processing face registration request")
         
-        data = request.get_json()
-        if not data:
+        data = get_request_data()
+        uploaded_frames = get_uploaded_images(['videoFrames', 'video_frames', 'frames'])
+        if not data and not uploaded_frames:
             return jsonify({"success": False, "error": "No data provided"}), 400
         
         # Accept both snake_case and camelCase field names
         employee_id = data.get('employeeId') or data.get('employee_id')
         employee_name = data.get('employeeName') or data.get('employee_name')
-        video_frames = data.get('videoFrames') or data.get('video_frames', [])
+        video_frames = uploaded_frames or data.get('videoFrames') or data.get('video_frames', [])
         
         logger.info(f"Received data - employee_id: {employee_id}, employee_name: {employee_name}, video_frames: {len(video_frames)}")
         
@@ -362,65 +1058,261 @@ def process_face_registration():
         if not video_frames:
             return jsonify({"success": False, "error": "No video frames provided"}), 400
         
+        try:
+            registration_output_options(data)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
         logger.info(f"Processing registration for {employee_name} (ID: {employee_id}) with {len(video_frames)} frames")
         
-        # Create enhanced face encoding
-        encoding = create_enhanced_face_encoding(employee_id, employee_name, video_frames)
+        # Analyze every frame once, then reuse the results for encoding and quality
+        pipeline = RegistrationPipeline(video_frames, max_frames=REGISTRATION_MAX_FRAMES)
         
-        # Calculate quality metrics
-        overall_quality = calculate_overall_quality(video_frames)
+        template_id = data.get('templateId') or data.get('template_id') or employee_id
+        response_data = complete_registration(pipeline, employee_id, employee_name, template_id, data)
         
-        # Prepare response
-        response_data = {
-            "success": True,
-            "encoding": encoding,
-            "quality_score": overall_quality,
-            "debug_info": {
-                "service_version": "2.0.0",
-                "frames_processed": len(video_frames),
-                "quality_threshold_passed": overall_quality >= 0.3,
-                "processing_timestamp": "2025-08-17T06:53:41Z"
-            }
-        }
+        logger.info(f"Registration successful for {employee_name}")
+        return jsonify(response_data)
         
-        # Convert numpy types before JSON serialization
-        response_data = convert_numpy_types(response_data)
+    except Exception as e:
+        logger.error(f"Error in face registration: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+def create_streaming_pipeline(options: Dict[str, Any]) -> RegistrationPipeline:
+    """Registration pipeline for frames that arrive incrementally, with early stop.
+    
+    Raises ValueError if the frame limits or the quality threshold are not numbers.
+    """
+    try:
+        max_frames = int(options.get('maxFrames') or options.get('max_frames') or STREAM_MAX_FRAMES)
+        target_good_frames = int(options.get('targetFrames') or options.get('target_frames') or STREAM_TARGET_FRAMES)
+        quality_threshold = float(options.get('qualityThreshold') or options.get('quality_threshold') or 0.3)
+    except (TypeError, ValueError):
+        raise ValueError("maxFrames and targetFrames must be integers and qualityThreshold a number")
+    if max_frames < 1 or target_good_frames < 1:
+        raise ValueError("maxFrames and targetFrames must be at least 1")
+    
+    return RegistrationPipeline(
+        max_frames=max_frames,
+        target_good_frames=target_good_frames,
+        quality_threshold=quality_threshold
+    )
+
+@app.route('/process/register/stream', methods=['POST'])
+@admission_controlled
+def process_face_registration_stream():
+    """Process face registration from a chunked NDJSON stream of frames.
+    
+    The first line (or the query string) carries employeeId/employeeName and
+    optional targetFrames/qualityThreshold/maxFrames; every following line is
+    a frame, either a JSON string or an object with a "frame" field. Frames are
+    scored as they are read and reading stops once enough good frames arrive.
+    """
+    try:
+        logger.info("Processing streaming face registration request")
+        
+        header = request.args.to_dict()
+        pipeline = None
+        target_reached = False
+        
+        for line in iter(request.stream.readline, b''):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                return jsonify({"success": False, "error": "Every line of the stream must be a JSON value"}), 400
+            
+            if pipeline is None and isinstance(item, dict) and not (item.get('frame') or item.get('image')):
+                header.update(item)
+                continue
+            if pipeline is None:
+                # The header is complete: reject it before paying for any frame
+                employee_id = header.get('employeeId') or header.get('employee_id')
+                employee_name = header.get('employeeName') or header.get('employee_name')
+                if not employee_id or not employee_name:
+                    return jsonify({"success": False, "error": "Missing employeeId or employeeName"}), 400
+                try:
+                    registration_output_options(header)
+                    pipeline = create_streaming_pipeline(header)
+                except ValueError as e:
+                    return jsonify({"success": False, "error": str(e)}), 400
+            
+            frame = (item.get('frame') or item.get('image')) if isinstance(item, dict) else item
+            pipeline.add_frame(frame)
+            if pipeline.is_complete:
+                target_reached = True
+                break
+        
+        employee_id = header.get('employeeId') or header.get('employee_id')
+        employee_name = header.get('employeeName') or header.get('employee_name')
+        if not employee_id or not employee_name:
+            return jsonify({"success": False, "error": "Missing employeeId or employeeName"}), 400
+        
+        if pipeline is None:
+            return jsonify({"success": False, "error": "No video frames provided"}), 400
+        
+        logger.info(f"Streamed registration for {employee_name} (ID: {employee_id}): {pipeline.frames_analyzed} frames analyzed, {pipeline.good_frames} good")
+        
+        template_id = header.get('templateId') or header.get('template_id') or employee_id
+        response_data = complete_registration(pipeline, employee_id, employee_name, template_id, header)
+        response_data["debug_info"]["target_reached"] = target_reached
         
         logger.info(f"Registration successful for {employee_name}")
         return jsonify(response_data)
         
     except Exception as e:
-        logger.error(f"Error in face registration: {e}")
+        logger.error(f"Error in streaming face registration: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+def dump_registration_session(session: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    meta, arrays = session["pipeline"].to_state()
+    return {**session, "pipeline": meta}, arrays
+
+def load_registration_session(meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    return {**meta, "pipeline": RegistrationPipeline.from_state(meta["pipeline"], arrays)}
+
+registration_sessions = RegistrationSessionStore(
+    REGISTRATION_SESSION_TTL, REGISTRATION_MAX_SESSIONS, REGISTRATION_SESSION_DIR,
+    dump=dump_registration_session, load=load_registration_session
+)
+
+@app.route('/process/register/session', methods=['POST'])
+def start_registration_session():
+    """Start a registration session that receives frames one request at a time"""
+    data = get_request_data()
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "error": "Request body must be a JSON object"}), 400
+    
+    employee_id = data.get('employeeId') or data.get('employee_id')
+    employee_name = data.get('employeeName') or data.get('employee_name')
+    if not employee_id or not employee_name:
+        return jsonify({"success": False, "error": "Missing employeeId or employeeName"}), 400
+    
+    try:
+        registration_output_options(data)
+        pipeline = create_streaming_pipeline(data)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    session_id = registration_sessions.start({
+        "pipeline": pipeline,
+        "employee_id": employee_id,
+        "employee_name": employee_name,
+        "template_id": data.get('templateId') or data.get('template_id') or employee_id,
+        "options": data
+    })
+    if session_id is None:
+        logger.warning(f"Rejected registration session: {REGISTRATION_MAX_SESSIONS} sessions in progress")
+        return jsonify({"success": False, "error": "Too many registration sessions in progress"}), 503
+    
+    logger.info(f"Started registration session {session_id} for {employee_name} (ID: {employee_id})")
+    return jsonify({
+        "success": True,
+        "session_id": session_id,
+        "target_frames": pipeline.target_good_frames,
+        "max_frames": pipeline.max_frames,
+        "quality_threshold": pipeline.quality_threshold
+    })
+
+@app.route('/process/register/session/<session_id>/frames', methods=['POST'])
+@admission_controlled
+def add_registration_session_frames(session_id):
+    """Score one or more frames of a registration session as they arrive"""
+    try:
+        data = get_request_data()
+        frames = get_uploaded_images(['frames', 'frame', 'image'])
+        if not frames:
+            frames = data.get('frames') or [frame for frame in [data.get('frame') or data.get('image')] if frame]
+        
+        with registration_sessions.open(session_id) as session:
+            if session is None:
+                return jsonify({"success": False, "error": "Unknown or expired session"}), 404
+            if not frames:
+                return jsonify({"success": False, "error": "No frames provided"}), 400
+            
+            pipeline = session["pipeline"]
+            qualities = []
+            for frame in frames:
+                analysis = pipeline.add_frame(frame)
+                qualities.append(analysis.quality if analysis is not None else None)
+        
+        return jsonify({
+            "success": True,
+            "frame_qualities": qualities,
+            "frames_received": pipeline.frame_count,
+            "frames_analyzed": pipeline.frames_analyzed,
+            "frames_skipped_duplicate": pipeline.frames_skipped,
+            "good_frames": pipeline.good_frames,
+            "complete": pipeline.is_complete
+        })
+        
+    except Exception as e:
+        logger.error(f"Error adding registration session frames: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/process/register/session/<session_id>/finish', methods=['POST'])
+@admission_controlled
+def finish_registration_session(session_id):
+    """Create the encoding from the frames collected by a registration session"""
+    try:
+        session = registration_sessions.pop(session_id)
+        if session is None:
+            return jsonify({"success": False, "error": "Unknown or expired session"}), 404
+        
+        response_data = complete_registration(
+            session["pipeline"], session["employee_id"], session["employee_name"], session["template_id"],
+            session["options"]
+        )
+        
+        logger.info(f"Registration successful for {session['employee_name']} (session {session_id})")
+        return jsonify(response_data)
+        
+    except Exception as e:
+        logger.error(f"Error finishing registration session: {e}")
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
+@app.route('/process/register/session/<session_id>', methods=['DELETE'])
+def cancel_registration_session(session_id):
+    """Discard a registration session"""
+    removed = registration_sessions.pop(session_id) is not None
+    return jsonify({"success": removed}), (200 if removed else 404)
+
 @app.route('/process/recognize', methods=['POST'])
+@admission_controlled
 def process_face_recognition():
     """Process face recognition from image"""
     try:
         logger.info("Processing face recognition request")
         
-        data = request.get_json()
-        if not data:
+        data = get_request_data()
+        image = get_request_image(data, ['image'])
+        if not data and image is None:
             return jsonify({"success": False, "error": "No data provided"}), 400
         
-        image = data.get('image')
         if not image:
             return jsonify({"success": False, "error": "No image provided"}), 400
         
-        logger.info(f"Processing recognition for image of size {len(image)} characters")
-        
-        # Analyze face quality
-        face_quality = analyze_enhanced_face_quality(image)
-        
-        # Extract face features
-        face_features = extract_face_features(image)
+        logger.info(f"Processing recognition for image of size {len(image)} {'bytes' if isinstance(image, bytes) else 'characters'}")
         
-        # Detect faces
-        cv_image = base64_to_image(image)
-        faces_detected = len(detect_faces(cv_image)) if cv_image is not None else 0
+        # Decode and detect once, then derive quality, features and face count
+        analysis = analyze_image_payload(image)
+        face_quality = analysis.quality
+        face_features = analysis.features
+        faces_detected = analysis.faces_count
         
         # Prepare response
         response_data = {
@@ -438,11 +1330,8 @@ def process_face_recognition():
             }
         }
         
-        # Convert numpy types before JSON serialization
-        response_data = convert_numpy_types(response_data)
-        
         logger.info(f"Recognition successful - Faces: {faces_detected}, Quality: {face_quality:.3f}")
-        return jsonify(response_data)
+        return respond(response_data)
         
     except Exception as e:
         logger.error(f"Error in face recognition: {e}")
@@ -451,32 +1340,54 @@ def process_face_recognition():
             "error": str(e)
         }), 500
 
+def get_tracking_session(session_id: str) -> Dict[str, Any]:
+    """Look up or create a kiosk tracking session, dropping expired ones"""
+    now = time.monotonic()
+    with tracking_sessions_lock:
+        for expired_id in [sid for sid, session in tracking_sessions.items() if session["expires_at"] < now]:
+            del tracking_sessions[expired_id]
+        session = tracking_sessions.setdefault(session_id, {"face": None, "frames_since_detection": 0})
+        session["expires_at"] = now + TRACKING_SESSION_TTL
+        return session
+
+def track_session_face(session: Dict[str, Any], analysis: FaceAnalysis):
+    """Remember the face box of a kiosk frame for the next frame of the session"""
+    with tracking_sessions_lock:
+        session["face"] = [int(v) for v in analysis.largest_face] if analysis.largest_face is not None else None
+        session["frames_since_detection"] = session["frames_since_detection"] + 1 if analysis.tracked else 0
+
 @app.route('/process/checkin', methods=['POST'])
+@admission_controlled
 def process_face_checkin():
     """Process face check-in and return features for matching"""
     try:
         logger.info("Processing face check-in request")
         
-        data = request.get_json()
-        if not data:
+        data = get_request_data()
+        # Accept both snake_case and camelCase field names
+        image = get_request_image(data, ['image', 'image_data'])
+        if not data and image is None:
             return jsonify({"success": False, "error": "No data provided"}), 400
         
-        # Accept both snake_case and camelCase field names
-        image = data.get('image') or data.get('image_data')
         if not image:
             return jsonify({"success": False, "error": "No image provided"}), 400
         
-        logger.info(f"Processing check-in for image of size {len(image)} characters")
+        logger.info(f"Processing check-in for image of size {len(image)} {'bytes' if isinstance(image, bytes) else 'characters'}")
         
-        # Analyze face quality
-        face_quality = analyze_enhanced_face_quality(image)
+        # Kiosks stream frames of one person under a session id; its last face
+        # box narrows detection to a region of interest
+        session_id = data.get('sessionId') or data.get('session_id') or request.headers.get('X-Session-Id')
+        session = get_tracking_session(session_id) if session_id else None
+        previous_face = None
+        if session is not None and session["frames_since_detection"] < TRACKING_REDETECT_INTERVAL:
+            previous_face = session["face"]
         
-        # Extract face features
-        face_features = extract_face_features(image)
-        
-        # Detect faces
-        cv_image = base64_to_image(image)
-        faces_detected = len(detect_faces(cv_image)) if cv_image is not None else 0
+        # Decode and detect once, then derive quality, features and face count
+        analysis = analyze_image_payload(image, previous_face)
+        if session is not None and analysis.decoded:
+            track_session_face(session, analysis)
+        face_quality = analysis.quality
+        faces_detected = analysis.faces_count
         
         if faces_detected == 0:
             return jsonify({
@@ -490,6 +1401,9 @@ def process_face_checkin():
                 "error": f"Face quality too low: {face_quality:.2f} (minimum: 0.3)"
             }), 400
         
+        # Extract face features only once the frame is known to be usable
+        face_features = analysis.features
+        
         # Prepare response with features for matching
         response_data = {
             "success": True,
@@ -502,15 +1416,14 @@ def process_face_checkin():
                 "image_size": len(image),
                 "quality_threshold_passed": face_quality >= 0.3,
                 "features_extracted": len(face_features),
+                "tracking_session": session_id,
+                "roi_search": analysis.tracked,
                 "processing_timestamp": "2025-08-17T06:53:41Z"
             }
         }
         
-        # Convert numpy types before JSON serialization
-        response_data = convert_numpy_types(response_data)
-        
         logger.info(f"Check-in processing successful - Faces: {faces_detected}, Quality: {face_quality:.3f}, Features: {len(face_features)}")
-        return jsonify(response_data)
+        return respond(response_data)
         
     except Exception as e:
         logger.error(f"Error in face check-in: {e}")
@@ -519,12 +1432,301 @@ def process_face_checkin():
             "error": str(e)
         }), 500
 
+def process_checkin_item(index: int, payload) -> Dict[str, Any]:
+    """Run the check-in analysis for one image of a batch, reporting errors per item"""
+    try:
+        if not payload:
+            return {"index": index, "success": False, "error": "No image provided"}
+        
+        analysis = analyze_image_payload(payload)
+        if not analysis.decoded:
+            return {"index": index, "success": False, "error": "Could not decode image"}
+        
+        face_quality = analysis.quality
+        faces_detected = analysis.faces_count
+        
+        if faces_detected == 0:
+            return {"index": index, "success": False, "error": "No face detected in image", "faces_count": 0}
+        
+        if face_quality < 0.3:
+            return {
+                "index": index,
+                "success": False,
+                "error": f"Face quality too low: {face_quality:.2f} (minimum: 0.3)",
+                "faces_count": faces_detected,
+                "face_quality": face_quality
+            }
+        
+        face_features = analysis.features
+        return {
+            "index": index,
+            "success": True,
+            "face_detected": True,
+            "faces_count": faces_detected,
+            "face_quality": face_quality,
+            "face_features": face_features,
+            "image_size": len(payload)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in batch check-in item {index}: {e}")
+        return {"index": index, "success": False, "error": str(e)}
+
+@app.route('/process/checkin/batch', methods=['POST'])
+@admission_controlled
+def process_face_checkin_batch():
+    """Process several check-in frames (e.g. from multiple gate cameras) in one request"""
+    try:
+        logger.info("Processing batch face check-in request")
+        
+        data = get_request_data()
+        images = get_uploaded_images(['images', 'image']) or data.get('images') or []
+        if not images:
+            return jsonify({"success": False, "error": "No images provided"}), 400
+        
+        if len(images) > MAX_BATCH_IMAGES:
+            return jsonify({
+                "success": False,
+                "error": f"Too many images: {len(images)} (maximum: {MAX_BATCH_IMAGES})"
+            }), 413
+        
+        # Analyze every frame on the worker pool; results keep the request order.
+        # Each item runs in a copy of the request context so its metrics keep the endpoint
+        contexts = [contextvars.copy_context() for _ in images]
+        results = list(batch_executor.map(lambda ctx, i, payload: ctx.run(process_checkin_item, i, payload),
+                                          contexts, range(len(images)), images))
+        succeeded = sum(1 for result in results if result["success"])
+        
+        response_data = {
+            "success": True,
+            "results": results,
+            "debug_info": {
+                "service_version": "2.0.0",
+                "images_received": len(images),
+                "images_succeeded": succeeded,
+                "workers": BATCH_WORKERS,
+                "processing_timestamp": "2025-08-17T06:53:41Z"
+            }
+        }
+        
+        logger.info(f"Batch check-in processed - Images: {len(images)}, Succeeded: {succeeded}")
+        return respond(response_data)
+        
+    except Exception as e:
+        logger.error(f"Error in batch face check-in: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/process/identify', methods=['POST'])
+@admission_controlled
+def process_face_identification():
+    """Identify a face against the enrolled gallery and return the top-k employees"""
+    try:
+        logger.info("Processing face identification request")
+        
+        data = get_request_data()
+        # Accept both snake_case and camelCase field names
+        image = get_request_image(data, ['image', 'image_data'])
+        if not data and image is None:
+            return jsonify({"success": False, "error": "No data provided"}), 400
+        
+        if not image:
+            return jsonify({"success": False, "error": "No image provided"}), 400
+        
+        top_k = data.get('topK', data.get('top_k'))
+        try:
+            top_k = 5 if top_k is None else int(top_k)
+        except (TypeError, ValueError):
+            top_k = 0
+        if top_k < 1:
+            return jsonify({"success": False, "error": "topK must be a positive integer"}), 400
+        min_score = float(data.get('minScore') or data.get('min_score') or 0.0)
+        
+        gallery_size = len(gallery)
+        if gallery_size == 0:
+            return jsonify({"success": False, "error": "No face templates enrolled"}), 404
+        # A batched search runs with the largest k in its batch, so keep k bounded
+        top_k = min(top_k, gallery_size)
+        
+        # Decode and detect once, then derive quality, features and face count
+        analysis = analyze_image_payload(image)
+        face_quality = analysis.quality
+        faces_detected = analysis.faces_count
+        
+        if faces_detected == 0:
+            return jsonify({
+                "success": False,
+                "error": "No face detected in image"
+            }), 400
+        
+        if face_quality < 0.3:
+            return jsonify({
+                "success": False,
+                "error": f"Face quality too low: {face_quality:.2f} (minimum: 0.3)"
+            }), 400
+        
+        face_features = analysis.features
+        if len(face_features) == 0:
+            return jsonify({"success": False, "error": "Failed to extract face features"}), 400
+        
+        # Score the probe against every enrolled template in one product
+        matches = [m for m in search_gallery(face_features, top_k) if m["score"] >= min_score]
+        
+        response_data = {
+            "success": True,
+            "face_detected": True,
+            "faces_count": faces_detected,
+            "face_quality": face_quality,
+            "matches": matches,
+            "best_match": matches[0] if matches else None,
+            "debug_info": {
+                "service_version": "2.0.0",
+                "image_size": len(image),
+                "gallery_size": len(gallery),
+                "features_extracted": len(face_features),
+                "processing_timestamp": "2025-08-17T06:53:41Z"
+            }
+        }
+        
+        if matches:
+            logger.info(f"Identification successful - Best: {matches[0]['employee_id']} ({matches[0]['score']:.3f})")
+        return respond(response_data)
+        
+    except ValueError as e:
+        logger.error(f"Error in face identification: {e}")
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in face identification: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/templates/migrate', methods=['POST'])
+def migrate_face_encodings():
+    """Convert legacy enhanced_features encodings (base64) into binary templates"""
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"success": False, "error": "No data provided"}), 400
+        
+        dtype = data.get('dtype', 'float32')
+        templates = []
+        errors = []
+        for i, encoding in enumerate(data.get('encodings', [])):
+            try:
+                templates.append(base64.b64encode(migrate_legacy_encoding(encoding, dtype)).decode('utf-8'))
+            except Exception as e:
+                templates.append(None)
+                errors.append({"index": i, "error": str(e)})
+        
+        return jsonify({"success": True, "templates": templates, "errors": errors})
+        
+    except Exception as e:
+        logger.error(f"Error migrating face encodings: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/gallery', methods=['GET'])
+def gallery_stats():
+    """Report the size of the identification gallery"""
+    return jsonify({"success": True, **gallery.stats()})
+
+@app.route('/gallery/templates', methods=['POST'])
+def load_gallery_templates():
+    """Bulk-load stored templates, e.g. the FaceEncoding rows of the backend"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"success": False, "error": "No data provided"}), 400
+        
+        templates = data.get('templates', [])
+        loaded = 0
+        errors = []
+        
+        for i, template in enumerate(templates):
+            try:
+                employee_id = template.get('employeeId') or template.get('employee_id')
+                template_id = template.get('templateId') or template.get('template_id') or template.get('id') or employee_id
+                if not employee_id:
+                    raise ValueError("Missing employeeId")
+                
+                features = template.get('features')
+                if features is None:
+                    features = parse_face_encoding(template.get('encoding', ''))
+                
+                gallery.add(template_id, employee_id, features)
+                loaded += 1
+            except Exception as e:
+                errors.append({"index": i, "error": str(e)})
+        
+        logger.info(f"Loaded {loaded} gallery templates ({len(errors)} errors)")
+        return jsonify({"success": True, "loaded": loaded, "errors": errors, **gallery.stats()})
+        
+    except Exception as e:
+        logger.error(f"Error loading gallery templates: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/gallery/compact', methods=['POST'])
+def compact_gallery():
+    """Rewrite the persisted gallery snapshot without deleted templates"""
+    if not isinstance(gallery, PersistentFaceGallery):
+        return jsonify({"success": False, "error": "Gallery is not persisted (GALLERY_DIR is not set)"}), 400
+    
+    try:
+        return jsonify({"success": True, **gallery.compact()})
+    except Exception as e:
+        logger.error(f"Error compacting gallery: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/gallery/index/train', methods=['POST'])
+def train_gallery_index():
+    """Refit the quantized index (ranges and IVF lists) to the current templates"""
+    if not isinstance(gallery, QuantizedFaceGallery):
+        return jsonify({"success": False, "error": "Gallery is not quantized (GALLERY_INDEX is not 'quantized')"}), 400
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        gallery.train(int(data.get('nlist') or 0) or None)
+        return jsonify({"success": True, **gallery.stats()})
+    except Exception as e:
+        logger.error(f"Error training gallery index: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/gallery/templates/<template_id>', methods=['DELETE'])
+def delete_gallery_template(template_id):
+    """Remove one template from the gallery"""
+    removed = gallery.remove(template_id)
+    return jsonify({"success": removed, "removed": int(removed)}), (200 if removed else 404)
+
+@app.route('/gallery/employees/<employee_id>', methods=['DELETE'])
+def delete_gallery_employee(employee_id):
+    """Remove every template of one employee from the gallery"""
+    removed = gallery.remove_employee(employee_id)
+    return jsonify({"success": removed > 0, "removed": removed}), (200 if removed else 404)
+
 if __name__ == '__main__':
     logger.info("Starting Enhanced Face Recognition Processing Service...")
     logger.info("Service will run on http://localhost:5000")
     logger.info("Endpoints:")
     logger.info("  GET  /health - Health check")
+    logger.info("  GET  /metrics - Prometheus metrics")
+    logger.info("  GET  /admin/profiles - Captured request profiles (PROFILE_DIR)")
     logger.info("  POST /process/register - Process face registration")
+    logger.info("  POST /process/register/stream - Streaming face registration (NDJSON)")
+    logger.info("  POST /process/register/session - Start a frame-by-frame registration session")
     logger.info("  POST /process/recognize - Process face recognition")
+    logger.info("  POST /process/checkin/batch - Process several check-in frames at once")
+    logger.info("  POST /process/identify - Identify a face against the gallery")
+    
+    # Load the face cascade and Gabor bank before the first request arrives
+    registry.warm_up()
     
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
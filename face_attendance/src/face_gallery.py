@@ -0,0 +1,166 @@
+import logging
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+class FaceGallery:
+    """In-memory 1:N identification gallery.
+
+    Every enrolled template is stored as one row of a contiguous, L2-normalized
+    float32 matrix, so identifying a probe is a single matrix-vector product.
+    Rows are keyed by template id; an employee may own several templates and
+    search results are reported per employee (best template wins). Scores use
+    the same (cosine + 1) / 2 scale as calculate_face_similarity.
+    """
+
+    INITIAL_CAPACITY = 256
+    MATRIX_DTYPE = np.float32
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self._matrix = np.empty((0, dim or 0), dtype=self.MATRIX_DTYPE)
+        self._count = 0
+        self._template_ids: List[str] = []
+        self._employee_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @staticmethod
+    def normalize(features) -> np.ndarray:
+        """L2-normalize one vector or each row of a matrix as float32"""
+        features = np.asarray(features, dtype=np.float32)
+        norms = np.linalg.norm(features, axis=-1, keepdims=True)
+        return features / (norms + 1e-8)
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._matrix.shape[0]:
+            return
+        capacity = max(self.INITIAL_CAPACITY, self._matrix.shape[0])
+        while capacity < rows:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dim), dtype=self.MATRIX_DTYPE)
+        matrix[:self._count] = self._matrix[:self._count]
+        self._matrix = matrix
+
+    def add(self, template_id: str, employee_id: str, features: Sequence[float]):
+        """Add a template, replacing any existing template with the same id"""
+        vector = self.normalize(features)
+        if vector.ndim != 1 or vector.size == 0:
+            raise ValueError("Template features must be a non-empty vector")
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vector.size
+                self._matrix = np.empty((0, self.dim), dtype=self.MATRIX_DTYPE)
+            if vector.size != self.dim:
+                raise ValueError(f"Feature length mismatch: {vector.size} vs gallery {self.dim}")
+
+            row = self._rows.get(template_id)
+            if row is None:
+                self._ensure_capacity(self._count + 1)
+                row = self._count
+                self._count += 1
+                self._template_ids.append(template_id)
+                self._employee_ids.append(employee_id)
+                self._rows[template_id] = row
+            else:
+                self._employee_ids[row] = employee_id
+            self._matrix[row] = vector
+
+    def remove(self, template_id: str) -> bool:
+        """Remove one template by moving the last row into its slot"""
+        with self._lock:
+            row = self._rows.pop(template_id, None)
+            if row is None:
+                return False
+
+            last = self._count - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._template_ids[row] = self._template_ids[last]
+                self._employee_ids[row] = self._employee_ids[last]
+                self._rows[self._template_ids[row]] = row
+            self._template_ids.pop()
+            self._employee_ids.pop()
+            self._count = last
+            return True
+
+    def remove_employee(self, employee_id: str) -> int:
+        """Remove every template owned by an employee"""
+        with self._lock:
+            template_ids = [t for t, e in zip(self._template_ids, self._employee_ids) if e == employee_id]
+            for template_id in template_ids:
+                self.remove(template_id)
+            return len(template_ids)
+
+    def search(self, features: Sequence[float], k: int = 5) -> List[Dict[str, Any]]:
+        """Return the top-k employees for one probe vector, best first"""
+        return self.search_batch(np.asarray(features, dtype=np.float32)[np.newaxis], k)[0]
+
+    def search_batch(self, probes: np.ndarray, k: int = 5) -> List[List[Dict[str, Any]]]:
+        """Return the top-k employees for each row of an (N, D) probe matrix"""
+        probes = self.normalize(probes)
+        with self._lock:
+            if len(self._rows) == 0:
+                return [[] for _ in range(len(probes))]
+            if probes.shape[1] != self.dim:
+                raise ValueError(f"Feature length mismatch: {probes.shape[1]} vs gallery {self.dim}")
+
+            scores = self._score(probes)
+            return [self._top_employees(row, k) for row in scores]
+
+    def _score(self, probes: np.ndarray) -> np.ndarray:
+        """Score normalized probes against every row; unused rows must score -inf"""
+        # One product scores every probe against every template
+        return probes @ self._matrix[:self._count].T
+
+    def _top_employees(self, scores: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Best template per employee, best first; scores[i] belongs to rows[i] (default: row i)"""
+        employee_ids = self._employee_ids
+        template_ids = self._template_ids
+        n = scores.shape[0]
+        # Look at a few templates per wanted employee first, widening only if
+        # the best rows are dominated by employees with many templates
+        m = min(n, max(k, 1) * 4)
+        while True:
+            if m < n:
+                candidates = np.argpartition(-scores, m - 1)[:m]
+            else:
+                candidates = np.arange(n)
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+            matches = []
+            seen = set()
+            for i in candidates:
+                if scores[i] == -np.inf:
+                    return matches
+                row = i if rows is None else rows[i]
+                employee_id = employee_ids[row]
+                if employee_id in seen:
+                    continue
+                seen.add(employee_id)
+                matches.append({
+                    "employee_id": employee_id,
+                    "template_id": template_ids[row],
+                    "score": float((scores[i] + 1) / 2)
+                })
+                if len(matches) == k:
+                    return matches
+            if m == n:
+                return matches
+            m = n
+
+    def stats(self) -> Dict[str, Any]:
+        """Template count, dimension and matrix memory footprint"""
+        with self._lock:
+            return {
+                "templates": len(self._rows),
+                "employees": len(set(self._employee_ids) - {None}),
+                "dimension": self.dim,
+                "matrix_bytes": int(self._matrix.nbytes)
+            }
@@ -0,0 +1,216 @@
+import logging
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+from face_gallery import FaceGallery
+
+logger = logging.getLogger(__name__)
+
+class QuantizedFaceGallery(FaceGallery):
+    """FaceGallery with an int8 scalar-quantized, optionally IVF-partitioned index.
+
+    Every template row also gets an int8 code (per-dimension affine
+    quantization, 4x smaller than float32). Once the gallery holds
+    ivf_min_templates templates, rows are partitioned into nlist clusters
+    (spherical k-means) and a probe only scans the rows of its nprobe closest
+    clusters. The rerank best candidates by quantized score are then scored
+    against the stored vectors, kept as float32 (scores identical to
+    exhaustive search for every template that reaches the shortlist) or, to
+    halve that store, float16 (rerank_dtype).
+
+    Codes and cluster assignments are kept row-aligned through adds and
+    swap-removes. Quantization ranges and centroids are retrained whenever
+    the gallery has doubled since the last training, or on train().
+    """
+
+    TRAIN_MIN_TEMPLATES = 256   # Fit quantization ranges from data from this size on
+    KMEANS_ITERATIONS = 10
+    KMEANS_SAMPLES_PER_LIST = 64
+
+    def __init__(self, dim: Optional[int] = None, nprobe: int = 8, rerank: int = 64, nlist: int = 0,
+                 ivf_min_templates: int = 4096, rerank_dtype: str = 'float32', seed: int = 0):
+        self.MATRIX_DTYPE = np.dtype(rerank_dtype)
+        super().__init__(dim)
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.nlist = nlist
+        self.ivf_min_templates = ivf_min_templates
+        self._rng = np.random.default_rng(seed)
+        self._codes = np.empty((0, dim or 0), dtype=np.int8)
+        self._assign = np.empty(0, dtype=np.int32)
+        self._low = None
+        self._scale = None
+        self._centroids = None
+        self._layout = None
+        self._trained_count = 0
+
+    # -- quantization ------------------------------------------------------
+
+    def _reset_ranges(self):
+        # Normalized vectors lie in [-1, 1] until ranges are fitted to the data
+        self._low = np.full(self.dim, -1.0, dtype=np.float32)
+        self._scale = np.full(self.dim, 2.0 / 255, dtype=np.float32)
+
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self._low) / self._scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def _assign_clusters(self, vectors: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.full(len(vectors), -1, dtype=np.int32)
+        return np.argmax(np.asarray(vectors, dtype=np.float32) @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _kmeans(self, vectors: np.ndarray, nlist: int) -> np.ndarray:
+        """Spherical k-means on a sample of the rows"""
+        sample_size = min(len(vectors), nlist * self.KMEANS_SAMPLES_PER_LIST)
+        sample = vectors[self._rng.choice(len(vectors), sample_size, replace=False)].astype(np.float32)
+        centroids = sample[self._rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Restart empty lists from random points
+                sums[empty] = sample[self._rng.choice(sample_size, int(empty.sum()))]
+            centroids = self.normalize(sums)
+        return centroids
+
+    def train(self, nlist: Optional[int] = None):
+        """Refit quantization ranges and IVF centroids to the current templates and re-encode"""
+        with self._lock:
+            if self.dim is None or self._count == 0:
+                return
+            vectors = np.asarray(self._matrix[:self._count], dtype=np.float32)
+
+            if self._count >= self.TRAIN_MIN_TEMPLATES:
+                low = np.percentile(vectors, 0.1, axis=0).astype(np.float32)
+                high = np.percentile(vectors, 99.9, axis=0).astype(np.float32)
+                self._low = low
+                self._scale = np.maximum(high - low, 1e-6).astype(np.float32) / 255
+            else:
+                self._reset_ranges()
+
+            nlist = nlist or self.nlist or int(np.sqrt(self._count))
+            if self._count >= self.ivf_min_templates and nlist > 1:
+                self._centroids = self._kmeans(vectors, min(nlist, self._count))
+            else:
+                self._centroids = None
+
+            self._codes[:self._count] = self._quantize(vectors)
+            self._assign[:self._count] = self._assign_clusters(vectors)
+            self._layout = None
+            self._trained_count = self._count
+            logger.info(f"Trained gallery index on {self._count} templates: "
+                        f"{0 if self._centroids is None else len(self._centroids)} lists")
+
+    def _inverted_lists(self):
+        """Rows sorted by cluster and each cluster's start offset, rebuilt after changes"""
+        if self._layout is None:
+            assign = self._assign[:self._count]
+            order = np.argsort(assign, kind='stable').astype(np.int64)
+            starts = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+            self._layout = (order, starts)
+        return self._layout
+
+    # -- row maintenance ---------------------------------------------------
+
+    def _ensure_capacity(self, rows: int):
+        super()._ensure_capacity(rows)
+        capacity = self._matrix.shape[0]
+        if self._codes.shape[0] < capacity:
+            codes = np.zeros((capacity, self.dim), dtype=np.int8)
+            assign = np.full(capacity, -1, dtype=np.int32)
+            if self._count:
+                codes[:self._count] = self._codes[:self._count]
+                assign[:self._count] = self._assign[:self._count]
+            self._codes, self._assign = codes, assign
+
+    def add(self, template_id: str, employee_id: str, features: Sequence[float]):
+        """Add or replace a template and index its code"""
+        with self._lock:
+            super().add(template_id, employee_id, features)
+            if self._low is None:
+                self._reset_ranges()
+            row = self._rows[template_id]
+            vector = np.asarray(self._matrix[row:row + 1], dtype=np.float32)
+            self._codes[row] = self._quantize(vector)[0]
+            self._assign[row] = self._assign_clusters(vector)[0]
+            self._layout = None
+
+            if self._count >= max(self.TRAIN_MIN_TEMPLATES, 2 * self._trained_count):
+                self.train()
+
+    def remove(self, template_id: str) -> bool:
+        """Remove a template, moving the last row's code into its slot"""
+        with self._lock:
+            row = self._rows.get(template_id)
+            last = self._count - 1
+            if not super().remove(template_id):
+                return False
+            if row != last:
+                self._codes[row] = self._codes[last]
+                self._assign[row] = self._assign[last]
+            self._layout = None
+            return True
+
+    # -- search ------------------------------------------------------------
+
+    def _candidates(self, probe: np.ndarray) -> np.ndarray:
+        order, starts = self._inverted_lists()
+        nprobe = min(self.nprobe, len(self._centroids))
+        lists = np.argpartition(-(self._centroids @ probe), nprobe - 1)[:nprobe]
+        return np.concatenate([order[starts[c]:starts[c + 1]] for c in lists])
+
+    def _rerank(self, probe: np.ndarray, rows: np.ndarray, approx: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        shortlist_size = max(self.rerank, k)
+        if len(rows) > shortlist_size:
+            keep = np.argpartition(-approx, shortlist_size - 1)[:shortlist_size]
+            rows = rows[keep]
+        exact = np.asarray(self._matrix[rows], dtype=np.float32) @ probe
+        return self._top_employees(exact, k, rows)
+
+    def search_batch(self, probes: np.ndarray, k: int = 5) -> List[List[Dict[str, Any]]]:
+        """Top-k employees per probe from the quantized shortlist, re-ranked exactly"""
+        probes = self.normalize(probes)
+        with self._lock:
+            if len(self._rows) == 0:
+                return [[] for _ in range(len(probes))]
+            if probes.shape[1] != self.dim:
+                raise ValueError(f"Feature length mismatch: {probes.shape[1]} vs gallery {self.dim}")
+
+            # Only the ranking matters, so the per-probe offset of the affine codes is dropped
+            weighted = probes * self._scale
+            if self._centroids is None:
+                all_rows = np.arange(self._count)
+                approx = weighted @ self._codes[:self._count].astype(np.float32).T
+                return [self._rerank(probe, all_rows, row_scores, k) for probe, row_scores in zip(probes, approx)]
+
+            results = []
+            for probe, weights in zip(probes, weighted):
+                rows = self._candidates(probe)
+                if len(rows) == 0:
+                    results.append([])
+                    continue
+                approx = self._codes[rows].astype(np.float32) @ weights
+                results.append(self._rerank(probe, rows, approx, k))
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Gallery stats plus index parameters and per-structure memory"""
+        with self._lock:
+            centroid_bytes = 0 if self._centroids is None else int(self._centroids.nbytes)
+            code_bytes = int(self._codes.nbytes)
+            assign_bytes = int(self._assign.nbytes)
+            return {
+                **super().stats(),
+                "index": "ivf-int8" if self._centroids is not None else "int8",
+                "nlist": 0 if self._centroids is None else len(self._centroids),
+                "nprobe": self.nprobe,
+                "rerank": self.rerank,
+                "rerank_dtype": str(self._matrix.dtype),
+                "code_bytes": code_bytes,
+                "centroid_bytes": centroid_bytes,
+                "index_bytes": int(self._matrix.nbytes) + code_bytes + assign_bytes + centroid_bytes,
+                "trained_templates": self._trained_count
+            }
@@ -0,0 +1,108 @@
+"""Compact, versioned binary face template format.
+
+Byte layout (all fields little-endian, 16-byte header):
+
+    offset  size  field
+    0       4     magic        b'FTPL'
+    4       1     version      1
+    5       1     dtype        1 = float32, 2 = float16
+    6       2     dim          number of features (uint16)
+    8       4     quality      registration quality score (float32)
+    12      4     reserved     0
+    16      dim * itemsize     packed features
+
+The header is 16 bytes, so the features are aligned for a zero-copy
+np.frombuffer view. Legacy 'enhanced_features' encodings (JSON, possibly
+base64-encoded) are still readable through load_template_features, and
+migrate_legacy_encoding converts them to this format.
+"""
+import base64
+import json
+import struct
+import numpy as np
+from typing import NamedTuple, Tuple, Union
+
+MAGIC = b'FTPL'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHfI')
+HEADER_SIZE = HEADER.size
+
+DTYPE_CODES = {
+    'float32': 1,
+    'float16': 2
+}
+CODE_DTYPES = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2')
+}
+
+class FaceTemplate(NamedTuple):
+    version: int
+    quality: float
+    features: np.ndarray
+
+def encode_template(features, quality: float = 0.0, dtype: str = 'float32') -> bytes:
+    """Pack a feature vector and its quality into the binary template format"""
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported template dtype: {dtype}")
+
+    code = DTYPE_CODES[dtype]
+    vector = np.asarray(features, dtype=CODE_DTYPES[code]).ravel()
+    if vector.size == 0 or vector.size > 0xFFFF:
+        raise ValueError(f"Invalid feature dimension: {vector.size}")
+
+    header = HEADER.pack(MAGIC, VERSION, code, vector.size, float(quality), 0)
+    return header + vector.tobytes()
+
+def is_binary_template(blob: bytes) -> bool:
+    """Whether the bytes start with the binary template magic"""
+    return bytes(blob[:4]) == MAGIC
+
+def decode_template(blob: bytes) -> FaceTemplate:
+    """Read a binary template; the features are a zero-copy view of the buffer"""
+    if len(blob) < HEADER_SIZE:
+        raise ValueError("Template is shorter than its header")
+
+    magic, version, code, dim, quality, _ = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not a binary face template")
+    if version != VERSION:
+        raise ValueError(f"Unsupported template version: {version}")
+    if code not in CODE_DTYPES:
+        raise ValueError(f"Unsupported template dtype code: {code}")
+
+    dtype = CODE_DTYPES[code]
+    if len(blob) < HEADER_SIZE + dim * dtype.itemsize:
+        raise ValueError("Template is shorter than its feature block")
+
+    features = np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER_SIZE)
+    return FaceTemplate(version, quality, features)
+
+def _raw_bytes(blob: Union[bytes, str]) -> bytes:
+    if isinstance(blob, str):
+        return base64.b64decode(blob)
+    blob = bytes(blob)
+    if is_binary_template(blob) or blob.lstrip().startswith(b'{'):
+        return blob
+    # Base64 text stored as bytes
+    return base64.b64decode(blob)
+
+def load_template_features(blob: Union[bytes, str]) -> Tuple[np.ndarray, float]:
+    """Features (float32) and quality of a binary template or a legacy JSON encoding.
+
+    Accepts raw bytes as stored in FaceEncoding.encoding, or the base64 text
+    returned by /process/register, in either format.
+    """
+    raw = _raw_bytes(blob)
+    if is_binary_template(raw):
+        template = decode_template(raw)
+        return template.features.astype(np.float32, copy=False), template.quality
+
+    encoding_data = json.loads(raw.decode('utf-8'))
+    features = encoding_data.get('features') or encoding_data.get('face_features') or []
+    return np.asarray(features, dtype=np.float32), float(encoding_data.get('quality', 0.0))
+
+def migrate_legacy_encoding(blob: Union[bytes, str], dtype: str = 'float32') -> bytes:
+    """Convert a legacy enhanced_features encoding into a binary template"""
+    features, quality = load_template_features(blob)
+    return encode_template(features, quality, dtype)
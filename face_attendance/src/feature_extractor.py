@@ -0,0 +1,127 @@
+import cv2
+import numpy as np
+from typing import Optional, Sequence
+from resource_registry import registry, GABOR_KERNELS
+
+FACE_SIZE = 128
+HIST_BINS = 32
+EDGE_SCALES = [1, 2, 4]
+LBP_BLOCK = 16
+LBP_FEATURES = 16
+GABOR_PAD = 10  # Half of the 21x21 Gabor kernel
+
+# 32 histogram + 3 edge + 4 Gabor + 16 block gradient + brightness/contrast
+# + aspect ratio + 3 HSV + 3 LAB
+FEATURE_DIM = HIST_BINS + len(EDGE_SCALES) + 4 + LBP_FEATURES + 2 + 1 + 3 + 3
+
+def crop_face(image, face) -> np.ndarray:
+    """Cut a face box out of a BGR image and resize it to the standard 128x128 crop"""
+    x, y, w, h = face
+    return cv2.resize(image[y:y+h, x:x+w], (FACE_SIZE, FACE_SIZE))
+
+def _block_gradient_features(gray_faces: np.ndarray) -> np.ndarray:
+    """Mean Sobel magnitude of the first 16 16x16 blocks of every face.
+
+    The blocks are split out with reshapes and each one is padded on its own
+    (reflect-101, like cv2.Sobel's default border), so the result matches
+    running cv2.Sobel block by block while computing every gradient in one
+    vectorized pass. Only the first 16 blocks in row-major order are kept,
+    so only the top two block rows are processed.
+    """
+    n = gray_faces.shape[0]
+    blocks_per_row = FACE_SIZE // LBP_BLOCK
+    block_rows = LBP_FEATURES // blocks_per_row
+    top = gray_faces[:, :block_rows * LBP_BLOCK, :].astype(np.float32)
+
+    blocks = top.reshape(n, block_rows, LBP_BLOCK, blocks_per_row, LBP_BLOCK)
+    blocks = blocks.transpose(0, 1, 3, 2, 4).reshape(n, LBP_FEATURES, LBP_BLOCK, LBP_BLOCK)
+    padded = np.pad(blocks, ((0, 0), (0, 0), (1, 1), (1, 1)), mode='reflect')
+
+    # 3x3 Sobel as separable [-1, 0, 1] derivative and [1, 2, 1] smoothing
+    diff_x = padded[..., :, 2:] - padded[..., :, :-2]
+    grad_x = diff_x[..., :-2, :] + 2.0 * diff_x[..., 1:-1, :] + diff_x[..., 2:, :]
+    diff_y = padded[..., 2:, :] - padded[..., :-2, :]
+    grad_y = diff_y[..., :, :-2] + 2.0 * diff_y[..., :, 1:-1] + diff_y[..., :, 2:]
+
+    gradient_magnitude = np.sqrt(grad_x * grad_x + grad_y * grad_y)
+    return gradient_magnitude.mean(axis=(2, 3)) / 255.0
+
+def _gabor_features(gray_faces: np.ndarray) -> np.ndarray:
+    """Mean Gabor response per kernel, filtering all faces with one filter2D call per kernel"""
+    n = gray_faces.shape[0]
+    # Pad each face by the kernel radius so stacked faces never see each other
+    padded = np.pad(gray_faces, ((0, 0), (GABOR_PAD, GABOR_PAD), (GABOR_PAD, GABOR_PAD)), mode='reflect')
+    stacked = padded.reshape(-1, padded.shape[2])
+
+    kernels = registry.get(GABOR_KERNELS)
+    features = np.empty((n, len(kernels)), dtype=np.float64)
+    for k, kernel in enumerate(kernels):
+        filtered = cv2.filter2D(stacked, cv2.CV_8UC3, kernel).reshape(padded.shape)
+        interior = filtered[:, GABOR_PAD:-GABOR_PAD, GABOR_PAD:-GABOR_PAD]
+        features[:, k] = interior.mean(axis=(1, 2)) / 255.0
+    return features
+
+def extract_features_batch(face_crops: np.ndarray, aspect_ratios: Optional[Sequence[float]] = None) -> np.ndarray:
+    """Extract recognition features for N aligned 128x128 BGR face crops.
+
+    Returns an (N, FEATURE_DIM) float32 matrix whose rows match the feature
+    vector produced for a single face. aspect_ratios holds the w/h ratio of
+    each original face box and defaults to 1.0.
+    """
+    face_crops = np.ascontiguousarray(face_crops, dtype=np.uint8)
+    if face_crops.ndim == 3:
+        face_crops = face_crops[np.newaxis]
+    n = face_crops.shape[0]
+    if n == 0:
+        return np.empty((0, FEATURE_DIM), dtype=np.float32)
+    if face_crops.shape[1:] != (FACE_SIZE, FACE_SIZE, 3):
+        raise ValueError(f"Expected (N, {FACE_SIZE}, {FACE_SIZE}, 3) face crops, got {face_crops.shape}")
+
+    # Colour conversions are per pixel, so all faces go through one call as a tall image
+    stacked = face_crops.reshape(n * FACE_SIZE, FACE_SIZE, 3)
+    gray_faces = cv2.cvtColor(stacked, cv2.COLOR_BGR2GRAY).reshape(n, FACE_SIZE, FACE_SIZE)
+    hsv = cv2.cvtColor(stacked, cv2.COLOR_BGR2HSV).reshape(n, -1, 3)
+    lab = cv2.cvtColor(stacked, cv2.COLOR_BGR2LAB).reshape(n, -1, 3)
+
+    features = np.empty((n, FEATURE_DIM), dtype=np.float32)
+    col = 0
+
+    # 1. Histogram features: 32 uniform bins over [0, 256) are the top 5 bits
+    bins = (gray_faces >> 3).reshape(n, -1).astype(np.intp) + (np.arange(n) * HIST_BINS)[:, np.newaxis]
+    hist = np.bincount(bins.ravel(), minlength=n * HIST_BINS).reshape(n, HIST_BINS).astype(np.float64)
+    features[:, col:col + HIST_BINS] = hist / (hist.sum(axis=1, keepdims=True) + 1e-8)
+    col += HIST_BINS
+
+    # 2. Edge density features (multiple scales)
+    for i in range(n):
+        for s, scale in enumerate(EDGE_SCALES):
+            resized = cv2.resize(gray_faces[i], (FACE_SIZE // scale, FACE_SIZE // scale))
+            edges = cv2.Canny(resized, 50, 150)
+            features[i, col + s] = np.count_nonzero(edges) / edges.size
+    col += len(EDGE_SCALES)
+
+    # 3. Texture features using Gabor filters
+    gabor = _gabor_features(gray_faces)
+    features[:, col:col + gabor.shape[1]] = gabor
+    col += gabor.shape[1]
+
+    # 4. Local Binary Pattern approximation (block gradient magnitude)
+    features[:, col:col + LBP_FEATURES] = _block_gradient_features(gray_faces)
+    col += LBP_FEATURES
+
+    # 5. Brightness and contrast features
+    flat_gray = gray_faces.reshape(n, -1)
+    features[:, col] = flat_gray.mean(axis=1) / 255.0
+    features[:, col + 1] = flat_gray.std(axis=1) / 255.0
+    col += 2
+
+    # 6. Shape features
+    features[:, col] = 1.0 if aspect_ratios is None else np.asarray(aspect_ratios, dtype=np.float64)
+    col += 1
+
+    # 7. Color features (HSV then LAB channel means)
+    features[:, col:col + 3] = hsv.mean(axis=1) / np.array([179.0, 255.0, 255.0])
+    col += 3
+    features[:, col:col + 3] = lab.mean(axis=1) / 255.0
+
+    return features
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+from typing import Optional
+
+HASH_SIZE = 16  # 16x16 difference hash = 256 bits
+
+def is_jpeg(image_bytes: bytes) -> bool:
+    return image_bytes[:2] == b'\xff\xd8'
+
+def image_signature(gray: np.ndarray, hash_size: int = HASH_SIZE) -> np.ndarray:
+    """Difference hash of a grayscale image, as hash_size * hash_size packed bits.
+
+    Each bit says whether a cell of the downsampled image is brighter than
+    its right neighbour, which ignores global exposure changes but not
+    movement.
+    """
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+def frame_signature(image_bytes: bytes, hash_size: int = HASH_SIZE) -> Optional[np.ndarray]:
+    """Difference hash of an encoded frame, None if the bytes do not decode.
+
+    JPEGs are decoded in grayscale at 1/8 scale by the DCT itself, so this
+    costs a fraction of a full decode. Other formats have no reduced decode;
+    callers that will analyze the frame anyway should decode it once and use
+    image_signature instead.
+    """
+    flags = cv2.IMREAD_REDUCED_GRAYSCALE_8 if is_jpeg(image_bytes) else cv2.IMREAD_GRAYSCALE
+    gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flags)
+    if gray is None:
+        return None
+    return image_signature(gray, hash_size)
+
+class NearDuplicateFilter:
+    """Skips frames that look almost the same as a frame already kept.
+
+    Every frame's signature is compared with the signatures of the frames
+    kept so far; it is a duplicate if it differs from any of them in fewer
+    than max_distance bits. Frames without a signature (they could not be
+    decoded) are always kept, so the full pipeline reports them as before.
+    A filter is restored from its kept signatures and skipped count.
+    """
+
+    def __init__(self, max_distance: int, hash_size: int = HASH_SIZE,
+                 kept: Optional[np.ndarray] = None, skipped: int = 0):
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        width = hash_size * hash_size // 8
+        self._kept = np.empty((0, width), dtype=np.uint8) if kept is None else np.asarray(kept, dtype=np.uint8).reshape(-1, width)
+        self.skipped = skipped
+
+    @property
+    def kept(self) -> np.ndarray:
+        """Signatures of the frames kept so far, one packed row each"""
+        return self._kept
+
+    def is_duplicate(self, signature: Optional[np.ndarray]) -> bool:
+        """Whether to skip the frame with this signature; frames that are kept are remembered"""
+        if signature is None:
+            return False
+        if len(self._kept):
+            distances = np.unpackbits(self._kept ^ signature, axis=1).sum(axis=1)
+            if distances.min() < self.max_distance:
+                self.skipped += 1
+                return True
+        self._kept = np.vstack([self._kept, signature])
+        return False
@@ -0,0 +1,280 @@
+import json
+import logging
+import os
+import numpy as np
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Sequence
+from face_gallery import FaceGallery
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "gallery.lock"
+
+class PersistentFaceGallery(FaceGallery):
+    """FaceGallery backed by a versioned, memory-mapped snapshot on disk.
+
+    Layout of the gallery directory:
+
+        manifest.json          {"version": N, "dim": D, "capacity": C}
+        gallery-<N>.npy        float32 (C, D) matrix of normalized templates
+        gallery-<N>.journal    one JSON line per add/delete since version N
+
+    The matrix is opened with np.load(mmap_mode='r+'), so opening a gallery
+    only maps the file and replays the journal; workers that map the same
+    version share its pages through the OS page cache. Adds and replaces
+    write the vector into the next free row, then append a journal line
+    (the journal line is the commit point). Deletes only append a journal
+    line, and the dead row is skipped at search time until compact() writes
+    a new version holding only live rows. Writers serialize on an flock, and
+    every process picks up other processes' changes by replaying the
+    journal tail before it reads or writes. A reader that finds the version
+    named by the manifest already removed by a newer compaction re-reads the
+    manifest once, under the writers' lock.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.version = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._journal_offset = 0
+        self._manifest_mtime = None
+        self._holds_file_lock = False
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            self._refresh()
+        logger.info(f"Opened gallery snapshot v{self.version} with {len(self)} templates from {directory}")
+
+    # -- paths -------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _matrix_path(self, version: int) -> str:
+        return self._path(f"gallery-{version:06d}.npy")
+
+    def _journal_path(self, version: int) -> str:
+        return self._path(f"gallery-{version:06d}.journal")
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self._path(LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._holds_file_lock = True
+            try:
+                yield
+            finally:
+                self._holds_file_lock = False
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # -- loading -----------------------------------------------------------
+
+    def _reset(self):
+        self._count = 0
+        self._template_ids = []
+        self._employee_ids = []
+        self._rows = {}
+        self._journal_offset = 0
+
+    def _refresh(self, retry: bool = True):
+        """Re-map a new snapshot version and replay any new journal lines"""
+        manifest_path = self._path(MANIFEST_FILE)
+        try:
+            manifest_mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        try:
+            if manifest_mtime != self._manifest_mtime:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                if manifest["version"] != self.version:
+                    matrix = np.load(self._matrix_path(manifest["version"]), mmap_mode='r+')
+                    self.version = manifest["version"]
+                    self.dim = manifest["dim"]
+                    self._matrix = matrix
+                    self._live = np.zeros(self._matrix.shape[0], dtype=bool)
+                    self._reset()
+                self._manifest_mtime = manifest_mtime
+            self._replay_journal()
+        except FileNotFoundError:
+            if not retry or self._holds_file_lock:
+                raise
+            # Another process compacted again after we read the manifest and removed
+            # the version it named. Re-read the manifest (even if its mtime looks
+            # unchanged: two compactions within one timestamp tick share an mtime)
+            # under the writers' lock, so no further compaction can race the retry
+            self._manifest_mtime = None
+            with self._file_lock():
+                self._refresh(retry=False)
+
+    def _replay_journal(self):
+        journal_path = self._journal_path(self.version)
+        # Every version is written with its journal, so a missing one was removed by a compaction
+        if os.path.getsize(journal_path) == self._journal_offset:
+            return
+
+        with open(journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            tail = f.read()
+
+        # Only apply complete lines; a concurrent writer may be mid-append
+        complete = tail[:tail.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            if line:
+                self._apply(json.loads(line))
+        self._journal_offset += len(complete)
+
+    def _apply(self, entry: Dict[str, Any]):
+        template_id = entry["template_id"]
+        old_row = self._rows.pop(template_id, None)
+        if old_row is not None:
+            self._live[old_row] = False
+            self._template_ids[old_row] = None
+            self._employee_ids[old_row] = None
+
+        if entry["op"] == "add":
+            row = entry["row"]
+            while len(self._template_ids) <= row:
+                self._template_ids.append(None)
+                self._employee_ids.append(None)
+            self._template_ids[row] = template_id
+            self._employee_ids[row] = entry["employee_id"]
+            self._rows[template_id] = row
+            self._live[row] = True
+            self._count = max(self._count, row + 1)
+
+    def _append_journal(self, entry: Dict[str, Any]):
+        line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+        with open(self._journal_path(self.version), 'ab') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(entry)
+        self._journal_offset += len(line)
+
+    # -- snapshot versions -------------------------------------------------
+
+    def _write_version(self, capacity: int):
+        """Write live rows into a new snapshot version and switch to it"""
+        version = self.version + 1
+        live_rows = [row for row in range(self._count) if self._live[row]]
+
+        matrix = np.lib.format.open_memmap(self._matrix_path(version), mode='w+', dtype=np.float32, shape=(capacity, self.dim))
+        if live_rows:
+            matrix[:len(live_rows)] = self._matrix[live_rows]
+        matrix.flush()
+        del matrix
+
+        with open(self._journal_path(version), 'wb') as f:
+            for new_row, row in enumerate(live_rows):
+                entry = {"op": "add", "row": new_row, "template_id": self._template_ids[row], "employee_id": self._employee_ids[row]}
+                f.write((json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+
+        manifest_tmp = self._path(MANIFEST_FILE + '.tmp')
+        with open(manifest_tmp, 'w') as f:
+            json.dump({"version": version, "dim": self.dim, "capacity": capacity}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(manifest_tmp, self._path(MANIFEST_FILE))
+
+        old_version = self.version
+        self._refresh()
+
+        # Processes still mapping the old file keep their mapping until they refresh
+        for path in (self._matrix_path(old_version), self._journal_path(old_version)):
+            if old_version and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove old gallery file {path}: {e}")
+
+        logger.info(f"Wrote gallery snapshot v{version}: {len(live_rows)} templates, capacity {capacity}")
+
+    def compact(self, capacity: Optional[int] = None) -> Dict[str, Any]:
+        """Drop deleted and replaced rows by writing a new snapshot version"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.dim is None:
+                return self.stats()
+            capacity = capacity or max(self.INITIAL_CAPACITY, 2 * len(self._rows))
+            self._write_version(capacity)
+            return self.stats()
+
+    # -- FaceGallery interface ---------------------------------------------
+
+    def add(self, template_id: str, employee_id: str, features: Sequence[float]):
+        """Add or replace a template and persist it"""
+        vector = self.normalize(features)
+        if vector.ndim != 1 or vector.size == 0:
+            raise ValueError("Template features must be a non-empty vector")
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.dim is None:
+                self.dim = vector.size
+                self._write_version(self.INITIAL_CAPACITY)
+            if vector.size != self.dim:
+                raise ValueError(f"Feature length mismatch: {vector.size} vs gallery {self.dim}")
+
+            if self._count == self._matrix.shape[0]:
+                # Out of rows: compact, growing if the live rows still fill half of it
+                self._write_version(max(self.INITIAL_CAPACITY, 2 * (len(self._rows) + 1)))
+
+            row = self._count
+            self._matrix[row] = vector
+            self._matrix.flush()
+            self._append_journal({"op": "add", "row": row, "template_id": template_id, "employee_id": employee_id})
+
+    def remove(self, template_id: str) -> bool:
+        """Delete a template; its row is reclaimed by the next compaction"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            if template_id not in self._rows:
+                return False
+            self._append_journal({"op": "delete", "template_id": template_id})
+            return True
+
+    def remove_employee(self, employee_id: str) -> int:
+        """Remove every template of an employee, including ones enrolled by other processes"""
+        with self._lock:
+            self._refresh()
+            template_ids = [t for t, e in zip(self._template_ids, self._employee_ids) if t is not None and e == employee_id]
+            return sum(self.remove(template_id) for template_id in template_ids)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def search_batch(self, probes: np.ndarray, k: int = 5):
+        with self._lock:
+            self._refresh()
+            return super().search_batch(probes, k)
+
+    def _score(self, probes: np.ndarray) -> np.ndarray:
+        scores = super()._score(probes)
+        scores[:, ~self._live[:self._count]] = -np.inf
+        return scores
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                **super().stats(),
+                "snapshot_version": self.version,
+                "dead_rows": int(self._count - len(self._rows)),
+                "directory": self.directory
+            }
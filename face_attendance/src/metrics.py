@@ -0,0 +1,319 @@
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Route of the request being served; copy the context into worker threads to keep it.
+# Work done outside a request (None) is not recorded.
+current_endpoint: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_endpoint', default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FACE_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10)
+BYTE_BUCKETS = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+BATCH_WAIT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, series: Dict[Tuple[str, ...], list]) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in sorted(series.items()):
+            base = format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                yield f"{self.name}_bucket{format_labels(self.label_names + ('le',), labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{base} {total}"
+            yield f"{self.name}_count{base} {count}"
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self, series: Dict[Tuple[str, ...], float]) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(series.items()):
+            yield f"{self.name}{format_labels(self.label_names, labels)} {value}"
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+class ServiceMetrics:
+    """Request, stage, face-count, image-size and error metrics in Prometheus text format.
+
+    Recording is a dict lookup and a few integer adds under one lock, cheap
+    enough to leave on in production. Metrics are per process; with
+    shared_dir set, each process also dumps its series to its own file there
+    from a background thread every flush_interval seconds, and render()
+    flushes its own file, then merges every file, so a scrape of any
+    gunicorn worker reports the whole server. Only files are merged, and each
+    only grows, so totals never go backwards between scrapes served by
+    different workers. The files of exited workers (retire() from
+    gunicorn's worker_exit, or found by render() when a worker was killed)
+    are folded into one aggregate file, so the directory does not grow with
+    worker recycling.
+    """
+
+    AGGREGATE_FILE = "metrics-aggregate.json"
+    LOCK_FILE = "metrics.lock"
+
+    def __init__(self, namespace: str = "face_api", shared_dir: Optional[str] = None, flush_interval: float = 1.0):
+        self.shared_dir = shared_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self._retired = False
+        self._flusher = None
+        self._flusher_pid = None
+        self.request_duration = Histogram(f"{namespace}_request_duration_seconds", "Total request time", ["endpoint"], LATENCY_BUCKETS)
+        self.stage_duration = Histogram(f"{namespace}_stage_duration_seconds", "Time spent in one pipeline stage", ["endpoint", "stage"], LATENCY_BUCKETS)
+        self.faces_detected = Histogram(f"{namespace}_faces_detected", "Faces detected per analyzed image", ["endpoint"], FACE_COUNT_BUCKETS)
+        self.image_bytes = Histogram(f"{namespace}_image_bytes", "Encoded size of each decoded image", ["endpoint"], BYTE_BUCKETS)
+        self.requests = Counter(f"{namespace}_requests_total", "Requests by endpoint and status code", ["endpoint", "status"])
+        self.errors = Counter(f"{namespace}_errors_total", "Requests answered with a 4xx or 5xx status", ["endpoint", "status"])
+        self.batch_size = Histogram(f"{namespace}_microbatch_size", "Items per micro-batch", ["batcher"], BATCH_SIZE_BUCKETS)
+        self.batch_wait = Histogram(f"{namespace}_microbatch_wait_seconds", "Time an item waited for its micro-batch to start", ["batcher"], BATCH_WAIT_BUCKETS)
+        self._metrics = [self.request_duration, self.stage_duration, self.faces_detected, self.image_bytes, self.requests, self.errors,
+                         self.batch_size, self.batch_wait]
+
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time a block as one pipeline stage of the current endpoint"""
+        endpoint = current_endpoint.get()
+        if endpoint is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stage_duration.observe((endpoint, stage), elapsed)
+
+    def observe_faces(self, count: int):
+        endpoint = current_endpoint.get()
+        if endpoint is not None:
+            with self._lock:
+                self.faces_detected.observe((endpoint,), count)
+
+    def observe_image_bytes(self, size: int):
+        endpoint = current_endpoint.get()
+        if endpoint is not None:
+            with self._lock:
+                self.image_bytes.observe((endpoint,), size)
+
+    def observe_batch(self, batcher: str, size: int, waits: Sequence[float]):
+        with self._lock:
+            self.batch_size.observe((batcher,), size)
+            for wait in waits:
+                self.batch_wait.observe((batcher,), wait)
+
+    def observe_request(self, endpoint: str, status: int, seconds: float):
+        labels = (endpoint, str(status))
+        with self._lock:
+            self.request_duration.observe((endpoint,), seconds)
+            self.requests.inc(labels)
+            if status >= 400:
+                self.errors.inc(labels)
+            self._dirty = True
+        if self.shared_dir:
+            self._ensure_flusher()
+
+    # -- multi-process sharing ---------------------------------------------
+
+    def _ensure_flusher(self):
+        """Start the flush thread on first use in each process (it does not survive a fork)"""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid != os.getpid():
+                self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+                self._flusher.start()
+                self._flusher_pid = os.getpid()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def _own_path(self) -> str:
+        return os.path.join(self.shared_dir, f"metrics-{os.getpid()}.json")
+
+    def flush(self):
+        """Write this process's series to its file in shared_dir"""
+        # One flush at a time, so an older snapshot never replaces a newer one
+        with self._flush_lock:
+            if self._retired:
+                # Already folded into the aggregate; writing again would count it twice
+                return
+            with self._lock:
+                self._dirty = False
+                snapshot = self._snapshot()
+            self._write_snapshot(self._own_path(), snapshot)
+
+    def retire(self):
+        """Final flush of an exiting worker, folding its series into the aggregate file"""
+        if not self.shared_dir:
+            return
+        self.flush()
+        with self._flush_lock:
+            self._retired = True
+            with self._dir_lock():
+                self._fold(self._own_path())
+
+    @contextmanager
+    def _dir_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.shared_dir, self.LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _snapshot(self) -> Dict[str, List]:
+        """Copy of every series as JSON-friendly [labels, value] pairs; call under the lock"""
+        return {
+            m.name: [[list(k), [list(v[0]), v[1], v[2]] if isinstance(v, list) else v] for k, v in m.series.items()]
+            for m in self._metrics
+        }
+
+    @staticmethod
+    def _read_snapshot(path: str) -> Optional[Dict[str, List]]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_snapshot(self, path: str, snapshot: Dict[str, List]):
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {e}")
+
+    @staticmethod
+    def _merge(merged: Dict[str, Dict[Tuple[str, ...], object]], snapshot: Dict[str, List]):
+        for name, series in snapshot.items():
+            target = merged.setdefault(name, {})
+            for labels, value in series:
+                labels = tuple(labels)
+                current = target.get(labels)
+                if current is None:
+                    target[labels] = value
+                elif isinstance(value, list):
+                    target[labels] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]]
+                else:
+                    target[labels] = current + value
+
+    def _fold(self, path: str):
+        """Add one worker's file to the aggregate file and remove it; call under the directory lock"""
+        snapshot = self._read_snapshot(path)
+        if snapshot is not None:
+            aggregate_path = os.path.join(self.shared_dir, self.AGGREGATE_FILE)
+            merged: Dict[str, Dict[Tuple[str, ...], object]] = {}
+            self._merge(merged, self._read_snapshot(aggregate_path) or {})
+            self._merge(merged, snapshot)
+            self._write_snapshot(aggregate_path, {name: [[list(k), v] for k, v in series.items()] for name, series in merged.items()})
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _worker_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _merged_series(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        self.flush()
+        merged = {m.name: {} for m in self._metrics}
+        with self._dir_lock():
+            paths = []
+            for path in glob.glob(os.path.join(self.shared_dir, "metrics-*.json")):
+                pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+                if not pid.isdigit():
+                    continue
+                # A worker killed before its worker_exit hook ran
+                if not self._worker_alive(int(pid)):
+                    self._fold(path)
+                    continue
+                paths.append(path)
+            for path in [os.path.join(self.shared_dir, self.AGGREGATE_FILE)] + paths:
+                snapshot = self._read_snapshot(path)
+                if snapshot is not None:
+                    self._merge(merged, {name: series for name, series in snapshot.items() if name in merged})
+        return merged
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        if self.shared_dir:
+            series = self._merged_series()
+        else:
+            with self._lock:
+                snapshot = self._snapshot()
+            series = {name: {tuple(k): v for k, v in pairs} for name, pairs in snapshot.items()}
+
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(series[metric.name]))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,146 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Result handed back to a caller whose batch would hold only its own item
+_RUN_INLINE = object()
+
+class MicroBatcher:
+    """Coalesces concurrent calls into batches for a vectorized function.
+
+    A caller with no other submit() outstanding runs process_batch([item])
+    on its own thread, so a lone request pays nothing for batching. Callers
+    that overlap queue their items for a background thread: from the first
+    queued item it waits up to max_wait_ms for more to arrive (stopping early
+    at max_batch_size), runs process_batch(items) once and hands each caller
+    its own result. A batch of one is handed back to its caller to run
+    inline, so the CPU work shows up in that request's profile. Calls only
+    overlap when the process serves requests on several threads. process_batch must return one result per item, in order; an
+    Exception instance in place of a result is raised in that item's caller
+    only, and if process_batch itself raises, every caller of the batch gets
+    the error.
+
+    on_batch(size, waits) is called after each batch with the seconds every
+    item spent queued, for metrics. The collector thread is started on first
+    use in each process, so instances created before a gunicorn fork work in
+    every worker.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], Sequence[Any]], max_batch_size: int = 16,
+                 max_wait_ms: float = 2.0, name: str = "batch",
+                 on_batch: Optional[Callable[[int, List[float]], None]] = None):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.on_batch = on_batch
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._outstanding = 0
+        self._stats = {"batches": 0, "items": 0, "max_batch_seen": 0, "inline": 0}
+
+    def submit(self, item: Any) -> Any:
+        """Process one item, batched with any concurrent submits, and return its result"""
+        with self._lock:
+            self._outstanding += 1
+            alone = self._outstanding == 1
+        try:
+            if alone:
+                return self._run_inline(item, 0.0)
+
+            self._ensure_thread()
+            future = Future()
+            queued_at = time.perf_counter()
+            self._queue.put((item, future, queued_at))
+            result = future.result()
+            if result is _RUN_INLINE:
+                return self._run_inline(item, time.perf_counter() - queued_at)
+            return result
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+
+    def _run_inline(self, item: Any, waited: float) -> Any:
+        result = self._checked(self.process_batch([item]), 1)[0]
+        self._record(1, [waited], inline=True)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _checked(self, results: Sequence[Any], size: int) -> Sequence[Any]:
+        if len(results) != size:
+            raise RuntimeError(f"{self.name} batch returned {len(results)} results for {size} items")
+        return results
+
+    def _record(self, size: int, waits: List[float], inline: bool = False):
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["items"] += size
+            self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], size)
+            if inline:
+                self._stats["inline"] += 1
+        if self.on_batch is not None:
+            self.on_batch(size, waits)
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.SimpleQueue()
+                self._thread = threading.Thread(target=self._run, name=f"micro-batch-{self.name}", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline, still take whatever is already queued
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if len(batch) == 1:
+                batch[0][1].set_result(_RUN_INLINE)
+                continue
+
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self._checked(self.process_batch(items), len(items))
+            except Exception as e:
+                logger.error(f"Error in {self.name} micro-batch of {len(items)}: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            self._record(len(batch), [started - queued_at for _, _, queued_at in batch])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches = self._stats["batches"]
+            return {
+                **self._stats,
+                "mean_batch_size": round(self._stats["items"] / batches, 2) if batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000
+            }
@@ -0,0 +1,164 @@
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIX = ".prof"
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]+-[a-z0-9_-]+-[0-9]+ms-[0-9a-f]{8}$')
+SORT_KEYS = frozenset(pstats.Stats.sort_arg_dict_default)
+
+class RequestProfiler:
+    """Opt-in cProfile capture of individual requests.
+
+    A request is profiled when it carries the trigger header (whose value
+    must equal token, if one is set) or when it is picked by 1-in-sample_every
+    sampling. The handler runs under cProfile and the stats are written to
+    directory as <epoch-ms>-<endpoint>-<duration>ms-<id>.prof, readable with
+    pstats or snakeviz; only the newest `retention` files are kept.
+
+    Hooks are only registered by install(), so a service without a profiler
+    pays nothing per request. cProfile sees the request thread only, and one
+    request is profiled at a time per process; requests arriving while another
+    is being profiled run unprofiled. When a token is set, the admin routes
+    also require it in the trigger header (see authorized()).
+    """
+
+    HEADER = "X-Profile-Request"
+    ID_HEADER = "X-Profile-Id"
+    # Reading profiles sends the trigger header too; never profile that
+    ADMIN_PATH = "/admin/profiles"
+
+    def __init__(self, directory: str, sample_every: int = 0, retention: int = 50, token: Optional[str] = None):
+        self.directory = directory
+        self.sample_every = sample_every
+        self.retention = retention
+        self.token = token
+        self._busy = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def install(self, app):
+        app.before_request(self._start)
+        app.after_request(self._tag_response)
+        app.teardown_request(self._finish)
+
+    def _wanted(self) -> bool:
+        if request.path.startswith(self.ADMIN_PATH):
+            return False
+        header = request.headers.get(self.HEADER)
+        if header is not None:
+            return self._token_matches(header) if self.token else header.lower() in ('1', 'true', 'yes')
+        return self.sample_every > 0 and random.randrange(self.sample_every) == 0
+
+    def _token_matches(self, value: str) -> bool:
+        return hmac.compare_digest(value.encode('utf-8'), self.token.encode('utf-8'))
+
+    def _start(self):
+        if not self._wanted() or not self._busy.acquire(blocking=False):
+            return
+        g.profile_started = time.perf_counter()
+        g.profile_id = None
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    def _tag_response(self, response):
+        profiler = g.get('profiler')
+        if profiler is not None:
+            profiler.disable()
+            g.profile_id = self._save(profiler, time.perf_counter() - g.profile_started)
+            if g.profile_id:
+                response.headers[self.ID_HEADER] = g.profile_id
+        return response
+
+    def _finish(self, exc):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        try:
+            if g.get('profile_id') is None:
+                # The request failed before after_request ran
+                profiler.disable()
+                self._save(profiler, time.perf_counter() - g.profile_started)
+        finally:
+            self._busy.release()
+
+    def _save(self, profiler: cProfile.Profile, seconds: float) -> Optional[str]:
+        endpoint = (request.url_rule.rule if request.url_rule else "unmatched").strip('/') or "root"
+        slug = re.sub(r'[^a-z0-9_]+', '_', endpoint.lower()).strip('_')[:40] or "root"
+        profile_id = f"{int(time.time() * 1000)}-{slug}-{int(seconds * 1000)}ms-{uuid.uuid4().hex[:8]}"
+        try:
+            profiler.dump_stats(os.path.join(self.directory, profile_id + PROFILE_SUFFIX))
+        except OSError as e:
+            logger.warning(f"Could not write request profile: {e}")
+            return None
+        logger.info(f"Profiled {request.method} {request.path} in {seconds * 1000:.1f} ms as {profile_id}")
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        profiles = self.list_profiles()
+        for profile in profiles[self.retention:]:
+            try:
+                os.remove(self.path(profile["id"]))
+            except FileNotFoundError:
+                pass
+
+    # -- admin access ------------------------------------------------------
+
+    def authorized(self) -> bool:
+        """Whether the current request may read profiles: always without a token, else the trigger header must match it"""
+        if not self.token:
+            return True
+        header = request.headers.get(self.HEADER)
+        return header is not None and self._token_matches(header)
+
+    def path(self, profile_id: str) -> Optional[str]:
+        """File of a captured profile, or None for an unknown or malformed id"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        return os.path.join(self.directory, profile_id + PROFILE_SUFFIX)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Captured profiles, newest first"""
+        profiles = []
+        for name in os.listdir(self.directory):
+            profile_id = name[:-len(PROFILE_SUFFIX)]
+            if not name.endswith(PROFILE_SUFFIX) or not PROFILE_ID_PATTERN.match(profile_id):
+                continue
+            created_ms, rest = profile_id.split('-', 1)
+            endpoint, duration, _ = rest.rsplit('-', 2)
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({
+                "id": profile_id,
+                "created_at": int(created_ms) / 1000,
+                "endpoint": endpoint,
+                "duration_ms": int(duration[:-2]),
+                "bytes": size
+            })
+        profiles.sort(key=lambda p: p["id"], reverse=True)
+        return profiles
+
+    def summary(self, profile_id: str, limit: int = 40, sort: str = 'cumulative') -> Optional[str]:
+        """Top functions of a profile as pstats text; sort must be one of SORT_KEYS"""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort}")
+        path = self.path(profile_id)
+        if path is None or not os.path.exists(path):
+            return None
+        output = io.StringIO()
+        pstats.Stats(path, stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
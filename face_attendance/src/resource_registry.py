@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+import cv2
+import numpy as np
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+FACE_CASCADE = "face_cascade"
+GABOR_KERNELS = "gabor_kernels"
+
+GABOR_ANGLES = [0, 45, 90, 135]
+
+class ResourceRegistry:
+    """Process-wide cache of expensive detection and feature resources.
+
+    Shared resources (read-only arrays) are built once and handed to every
+    caller. Pooled resources (objects that are not safe to use from two
+    threads at once, such as cv2.CascadeClassifier) are borrowed with
+    acquire() and returned afterwards, so a worker only ever parses as many
+    instances as it has concurrent requests. Hits, misses and load times are
+    tracked so they can be reported from /health.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._pooled: Dict[str, bool] = {}
+        self._resources: Dict[str, Any] = {}
+        self._idle: Dict[str, List[Any]] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any], pooled: bool = False):
+        """Register a loader for a named resource"""
+        self._loaders[name] = loader
+        self._pooled[name] = pooled
+        self._idle[name] = []
+        self._stats[name] = {"hits": 0, "misses": 0, "instances": 0, "load_time_ms": 0.0}
+
+    def _load(self, name: str) -> Any:
+        stats = self._stats[name]
+        start = time.perf_counter()
+        resource = self._loaders[name]()
+        load_time_ms = (time.perf_counter() - start) * 1000.0
+
+        with self._lock:
+            stats["misses"] += 1
+            stats["instances"] += 1
+            stats["load_time_ms"] += load_time_ms
+
+        logger.info(f"Loaded resource '{name}' in {load_time_ms:.1f} ms")
+        return resource
+
+    def get(self, name: str) -> Any:
+        """Return a shared resource, loading it on first use"""
+        resource = self._resources.get(name)
+        if resource is not None:
+            self._stats[name]["hits"] += 1
+            return resource
+
+        with self._lock:
+            resource = self._resources.get(name)
+        if resource is not None:
+            self._stats[name]["hits"] += 1
+            return resource
+
+        resource = self._load(name)
+        with self._lock:
+            # Keep the first instance if another thread loaded it concurrently
+            resource = self._resources.setdefault(name, resource)
+        return resource
+
+    @contextmanager
+    def acquire(self, name: str):
+        """Borrow a pooled resource for the duration of the block"""
+        with self._lock:
+            idle = self._idle[name]
+            resource = idle.pop() if idle else None
+            if resource is not None:
+                self._stats[name]["hits"] += 1
+
+        if resource is None:
+            resource = self._load(name)
+
+        try:
+            yield resource
+        finally:
+            with self._lock:
+                self._idle[name].append(resource)
+
+    def warm_up(self):
+        """Load one instance of every registered resource ahead of the first request"""
+        for name, pooled in self._pooled.items():
+            if pooled:
+                with self._lock:
+                    loaded = bool(self._idle[name])
+                if not loaded:
+                    resource = self._load(name)
+                    with self._lock:
+                        self._idle[name].append(resource)
+            else:
+                self.get(name)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss counters and cumulative load time for each resource"""
+        with self._lock:
+            return {
+                name: {
+                    **stats,
+                    "load_time_ms": round(stats["load_time_ms"], 3),
+                    "loaded": stats["instances"] > 0
+                }
+                for name, stats in self._stats.items()
+            }
+
+def load_face_cascade():
+    """Parse the Haar frontal face cascade"""
+    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    if face_cascade.empty():
+        raise RuntimeError("Failed to load haarcascade_frontalface_default.xml")
+    return face_cascade
+
+def build_gabor_kernels():
+    """Precompute the Gabor filter bank used for texture features"""
+    return [
+        cv2.getGaborKernel((21, 21), 8.0, np.radians(angle), 10.0, 0.5, 0, ktype=cv2.CV_32F)
+        for angle in GABOR_ANGLES
+    ]
+
+registry = ResourceRegistry()
+registry.register(FACE_CASCADE, load_face_cascade, pooled=True)
+registry.register(GABOR_KERNELS, build_gabor_kernels)
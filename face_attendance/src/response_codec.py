@@ -0,0 +1,107 @@
+"""Response serialization: numpy-aware JSON and a compact binary format.
+
+JSON responses may contain numpy scalars and arrays directly; numpy_default
+converts them while the encoder runs, so handlers need no conversion pass.
+
+Callers that send `Accept: application/x-face-response` get the binary
+format instead. Byte layout (all fields little-endian, 16-byte header):
+
+    offset  size  field
+    0       4     magic            b'FRSP'
+    4       1     version          1
+    5       1     dtype            1 = float32
+    6       2     reserved         0
+    8       4     metadata_length  bytes of JSON metadata, including padding
+    12      4     feature_count    number of float32 values that follow it
+    16      metadata_length        UTF-8 JSON, space-padded to a multiple of 4
+    ...     feature_count * 4      packed features
+
+The metadata is the JSON response with every feature array (face_features
+or features) replaced by {"$features": [offset, length]}, an index into the
+packed block, so features are read without parsing float text.
+"""
+import json
+import struct
+import numpy as np
+from typing import Any, Dict, List, Tuple
+
+BINARY_MIMETYPE = 'application/x-face-response'
+MAGIC = b'FRSP'
+VERSION = 1
+FLOAT32 = 1
+HEADER = struct.Struct('<4sBBHII')
+HEADER_SIZE = HEADER.size
+FEATURE_KEYS = ('face_features', 'features')
+FEATURE_REF = '$features'
+
+def numpy_default(obj):
+    """JSON encoder fallback for numpy scalars and arrays"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _extract_features(obj, blocks: List[np.ndarray], offset: int) -> Tuple[Any, int]:
+    """Copy of obj with feature arrays replaced by references; appends them to blocks"""
+    if isinstance(obj, dict):
+        result = {}
+        for key, value in obj.items():
+            if key in FEATURE_KEYS and isinstance(value, (list, tuple, np.ndarray)):
+                vector = np.asarray(value, dtype='<f4').ravel()
+                blocks.append(vector)
+                result[key] = {FEATURE_REF: [offset, vector.size]}
+                offset += vector.size
+            else:
+                result[key], offset = _extract_features(value, blocks, offset)
+        return result, offset
+    if isinstance(obj, (list, tuple)):
+        result = []
+        for item in obj:
+            item, offset = _extract_features(item, blocks, offset)
+            result.append(item)
+        return result, offset
+    return obj, offset
+
+def encode_response(obj: Dict[str, Any]) -> bytes:
+    """Pack a response as JSON metadata plus little-endian float32 features"""
+    blocks: List[np.ndarray] = []
+    metadata, feature_count = _extract_features(obj, blocks, 0)
+
+    meta = json.dumps(metadata, default=numpy_default, separators=(',', ':')).encode('utf-8')
+    # Pad so the features start 4-byte aligned for a zero-copy view
+    meta += b' ' * (-len(meta) % 4)
+
+    header = HEADER.pack(MAGIC, VERSION, FLOAT32, 0, len(meta), feature_count)
+    features = np.concatenate(blocks).tobytes() if blocks else b''
+    return header + meta + features
+
+def _resolve_features(obj, features: np.ndarray):
+    if isinstance(obj, dict):
+        ref = obj.get(FEATURE_REF)
+        if ref is not None and len(obj) == 1:
+            offset, length = ref
+            return features[offset:offset + length]
+        return {key: _resolve_features(value, features) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_resolve_features(item, features) for item in obj]
+    return obj
+
+def decode_response(blob: bytes) -> Dict[str, Any]:
+    """Read a binary response; feature arrays come back as float32 views of the buffer"""
+    if len(blob) < HEADER_SIZE:
+        raise ValueError("Response is shorter than its header")
+
+    magic, version, dtype, _, meta_length, feature_count = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not a binary face response")
+    if version != VERSION:
+        raise ValueError(f"Unsupported response version: {version}")
+    if dtype != FLOAT32:
+        raise ValueError(f"Unsupported response dtype code: {dtype}")
+    if len(blob) < HEADER_SIZE + meta_length + feature_count * 4:
+        raise ValueError("Response is shorter than its payload")
+
+    metadata = json.loads(bytes(blob[HEADER_SIZE:HEADER_SIZE + meta_length]).decode('utf-8'))
+    features = np.frombuffer(blob, dtype='<f4', count=feature_count, offset=HEADER_SIZE + meta_length)
+    return _resolve_features(metadata, features)
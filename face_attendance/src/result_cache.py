@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """Bounded LRU cache with a TTL for per-image analysis results.
+
+    Entries are keyed by a BLAKE2b hash of the encoded image bytes (plus a
+    namespace for the settings that affect the result), so retried and
+    repeated frames skip decode, detection, quality scoring and feature
+    extraction. With shared_dir set (e.g. a directory on /dev/shm), entries
+    are also written there as small JSON files so worker processes can serve
+    each other's results; the in-process LRU stays the first level.
+    """
+
+    PRUNE_INTERVAL = 64  # Shared-directory puts between prunes
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 60.0,
+                 namespace: str = "", shared_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace.encode('utf-8')
+        self.shared_dir = shared_dir
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared_puts = 0
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+
+    def key(self, image_bytes: bytes) -> str:
+        """Content hash of the encoded image bytes"""
+        digest = hashlib.blake2b(image_bytes, digest_size=16, key=self.namespace[:64])
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached value for a key, or None on a miss or expired entry"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expired"] += 1
+
+        value = self._get_shared(key)
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats["shared_hits"] += 1
+                self._store(key, value, now)
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a JSON-serializable value"""
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        self._put_shared(key, value)
+
+    def _store(self, key: str, value: Dict[str, Any], stored_at: float):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _shared_path(self, key: str) -> str:
+        return os.path.join(self.shared_dir, f"{key}.json")
+
+    def _get_shared(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.shared_dir:
+            return None
+        path = self._shared_path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl_seconds:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _put_shared(self, key: str, value: Dict[str, Any]):
+        if not self.shared_dir:
+            return
+        path = self._shared_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(value, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write shared cache entry: {e}")
+            return
+
+        with self._lock:
+            self._shared_puts += 1
+            prune = self._shared_puts % self.PRUNE_INTERVAL == 0
+        if prune:
+            self._prune_shared()
+
+    def _prune_shared(self):
+        """Drop expired files and keep at most max_entries of the newest"""
+        try:
+            entries = []
+            now = time.time()
+            for entry in os.scandir(self.shared_dir):
+                if not entry.name.endswith('.json'):
+                    continue
+                mtime = entry.stat().st_mtime
+                if now - mtime > self.ttl_seconds:
+                    self._remove_shared(entry.path)
+                else:
+                    entries.append((mtime, entry.path))
+            entries.sort()
+            for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+                self._remove_shared(path)
+        except OSError as e:
+            logger.warning(f"Could not prune shared cache: {e}")
+
+    @staticmethod
+    def _remove_shared(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another worker pruned it first
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "shared": bool(self.shared_dir)
+            }
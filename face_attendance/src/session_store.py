@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
+from response_codec import numpy_default
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+SESSION_SUFFIX = ".npz"
+LOCK_SUFFIX = ".lock"
+
+# A session as stored on disk: JSON-serializable metadata plus named arrays
+SessionState = Tuple[Dict[str, Any], Dict[str, np.ndarray]]
+
+class RegistrationSessionStore:
+    """In-progress registration sessions that expire ttl_seconds after their last use.
+
+    Without a directory, sessions are objects in this process's memory, which
+    only works when a single process serves every request. With directory
+    set, each session is a <id>.npz file there: dump(session) turns it into
+    JSON metadata plus numpy arrays (nothing is pickled, so nothing read back
+    is executed) and load() rebuilds it, so the requests of one session can
+    land on any worker. A request holds an flock on <id>.lock while it loads,
+    updates and atomically rewrites its session, which serializes the
+    requests of one session without blocking any other session.
+
+    At most max_sessions live sessions are kept; start() returns None beyond
+    that, after dropping expired ones.
+    """
+
+    DIRECTORY_LOCK = "sessions.lock"
+
+    def __init__(self, ttl_seconds: float, max_sessions: int, directory: Optional[str] = None,
+                 dump: Optional[Callable[[Any], SessionState]] = None,
+                 load: Optional[Callable[[Dict[str, Any], Dict[str, np.ndarray]], Any]] = None):
+        if directory and (dump is None or load is None):
+            raise ValueError("A session directory needs dump and load functions")
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.directory = directory
+        self.dump = dump
+        self.load = load
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def start(self, session: Any) -> Optional[str]:
+        """Store a new session and return its id, or None if max_sessions are live"""
+        session_id = uuid.uuid4().hex
+        if not self.directory:
+            with self._lock:
+                self._purge_memory()
+                if len(self._sessions) >= self.max_sessions:
+                    return None
+                self._sessions[session_id] = {
+                    "session": session,
+                    "lock": threading.Lock(),
+                    "expires_at": time.monotonic() + self.ttl_seconds
+                }
+            return session_id
+
+        with self._directory_lock():
+            if self._purge_files() >= self.max_sessions:
+                return None
+            os.close(os.open(self._path(session_id, LOCK_SUFFIX), os.O_CREAT | os.O_WRONLY, 0o600))
+            self._write(session_id, session)
+        return session_id
+
+    @contextmanager
+    def open(self, session_id: str) -> Iterator[Optional[Any]]:
+        """Lock a session for one request and yield it, or None if it is unknown or expired.
+
+        Changes made in the block are kept and the TTL restarts when the block
+        exits normally; if it raises, a directory-backed session is left as it was.
+        """
+        if not self.directory:
+            with self._lock:
+                self._purge_memory()
+                entry = self._sessions.get(session_id)
+            if entry is None:
+                yield None
+                return
+            with entry["lock"]:
+                yield entry["session"]
+                entry["expires_at"] = time.monotonic() + self.ttl_seconds
+            return
+
+        lock_fd = self._lock_session(session_id)
+        if lock_fd is None:
+            yield None
+            return
+        try:
+            session = self._read(session_id)
+            yield session
+            if session is not None:
+                self._write(session_id, session)
+        finally:
+            os.close(lock_fd)
+
+    def pop(self, session_id: str) -> Optional[Any]:
+        """Remove a session and return it, waiting for a request that is updating it"""
+        if not self.directory:
+            with self._lock:
+                self._purge_memory()
+                entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return None
+            with entry["lock"]:
+                return entry["session"]
+
+        lock_fd = self._lock_session(session_id)
+        if lock_fd is None:
+            return None
+        try:
+            session = self._read(session_id)
+            self._remove(session_id)
+            return session
+        finally:
+            os.close(lock_fd)
+
+    def __len__(self) -> int:
+        if not self.directory:
+            with self._lock:
+                self._purge_memory()
+                return len(self._sessions)
+        with self._directory_lock():
+            return self._purge_files()
+
+    # -- in-memory sessions ------------------------------------------------
+
+    def _purge_memory(self):
+        now = time.monotonic()
+        for expired_id in [sid for sid, entry in self._sessions.items() if entry["expires_at"] < now]:
+            del self._sessions[expired_id]
+
+    # -- directory-backed sessions -------------------------------------------
+
+    def _path(self, session_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, session_id + suffix)
+
+    @contextmanager
+    def _directory_lock(self):
+        """Serialize session creation and expiry across processes"""
+        with open(os.path.join(self.directory, self.DIRECTORY_LOCK), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _lock_session(self, session_id: str, blocking: bool = True) -> Optional[int]:
+        """Open and flock a session's lock file; None if there is no such session (or it is busy)"""
+        if not SESSION_ID_PATTERN.match(session_id):
+            return None
+        try:
+            # Never created here: the lock file exists exactly as long as its session
+            lock_fd = os.open(self._path(session_id, LOCK_SUFFIX), os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(lock_fd)
+                return None
+        return lock_fd
+
+    def _expired(self, path: str) -> bool:
+        # Every update rewrites the file, so its mtime is the session's last use
+        return time.time() - os.stat(path).st_mtime > self.ttl_seconds
+
+    def _read(self, session_id: str) -> Optional[Any]:
+        """Load a locked session; an expired one is removed instead"""
+        path = self._path(session_id, SESSION_SUFFIX)
+        try:
+            if self._expired(path):
+                self._remove(session_id)
+                return None
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(data["meta"].tobytes().decode('utf-8'))
+                arrays = {name: data[name] for name in data.files if name != "meta"}
+        except FileNotFoundError:
+            # Finished, cancelled or expired while we waited for the lock
+            return None
+        return self.load(meta, arrays)
+
+    def _write(self, session_id: str, session: Any):
+        meta, arrays = self.dump(session)
+        encoded = json.dumps(meta, default=numpy_default, separators=(',', ':')).encode('utf-8')
+        path = self._path(session_id, SESSION_SUFFIX)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.frombuffer(encoded, dtype=np.uint8), **arrays)
+        os.replace(tmp_path, path)
+
+    def _remove(self, session_id: str):
+        """Delete a session's files; the caller holds its lock"""
+        for suffix in (SESSION_SUFFIX, LOCK_SUFFIX):
+            try:
+                os.remove(self._path(session_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _purge_files(self) -> int:
+        """Drop expired sessions nobody is using; returns the number of live ones"""
+        live = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(SESSION_SUFFIX):
+                continue
+            session_id = entry.name[:-len(SESSION_SUFFIX)]
+            try:
+                if not self._expired(entry.path):
+                    live += 1
+                    continue
+            except FileNotFoundError:
+                continue
+            # A session being updated right now is not expired, whatever its mtime says
+            lock_fd = self._lock_session(session_id, blocking=False)
+            if lock_fd is None:
+                live += 1
+                continue
+            try:
+                if self._expired(entry.path):
+                    self._remove(session_id)
+                else:
+                    live += 1
+            except FileNotFoundError:
+                pass
+            finally:
+                os.close(lock_fd)
+        return live
@@ -0,0 +1,323 @@
+import logging
+import mmap
+import os
+import tempfile
+import time
+import numpy as np
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from face_gallery import FaceGallery
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ID_BYTES = 64
+# Control block fields (uint64 each)
+SEQ, COUNT, DIM, CAPACITY, SEGMENT = range(5)
+CONTROL_FIELDS = 8
+
+class _IdColumn:
+    """Read-only str view of a fixed-width id column in shared memory"""
+
+    def __init__(self, array: np.ndarray):
+        self._array = array
+
+    def __getitem__(self, row: int) -> str:
+        return self._array[row].decode('utf-8', 'replace')
+
+def _attach(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """Open or create a segment whose lifetime is managed explicitly with unlink()"""
+    if create:
+        try:
+            segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left over from a server that was killed before it could unlink
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+    else:
+        segment = shared_memory.SharedMemory(name=name)
+    # Python < 3.13 would unlink the segment when whichever process touched it
+    # first exits, including a recycled worker; the server unlinks it instead
+    try:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    except Exception:
+        pass
+    return segment
+
+def _unlink(name: str):
+    try:
+        segment = _attach(name)
+    except FileNotFoundError:
+        return
+    segment.close()
+    # unlink() also unregisters from the resource tracker; register first so that balances
+    resource_tracker.register(segment._name, 'shared_memory')
+    segment.unlink()
+
+class SharedMemoryFaceGallery(FaceGallery):
+    """FaceGallery whose matrix and id table live in POSIX shared memory.
+
+    All worker processes on a node map the same pages, so resident memory
+    does not grow with the worker count and an enrollment in one worker is
+    visible to every other worker at once.
+
+    A small control segment <name> holds a sequence counter, the row count,
+    the dimension, the capacity and the index of the current data segment
+    <name>-<index>, which holds a float32 (capacity, dim) matrix followed by
+    fixed-width (ID_BYTES) template and employee id columns. Writes are
+    serialized across processes by an flock and bracketed by two increments
+    of the sequence counter (odd while a write is in progress). Readers take
+    no locks: they score against the shared rows and retry if the counter
+    moved, so every search sees one consistent generation. A reader that
+    cannot get a consistent read within READ_TIMEOUT seconds reads once under
+    the write lock instead. A writer that finds the counter odd after taking
+    the lock knows the previous writer died mid-write, and makes it even
+    again. When the matrix is full the writer copies it into a new, larger
+    data segment and bumps the segment index; readers re-attach on their
+    next search.
+    """
+
+    # Seconds of lock-free retries before a reader falls back to the write lock
+    READ_TIMEOUT = 0.5
+
+    def __init__(self, name: str, lock_path: Optional[str] = None):
+        super().__init__()
+        self.name = name
+        self.lock_path = lock_path or os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._segment_index = None
+        self._synced_seq = None
+        self._template_column = None
+        self._employee_column = None
+
+        try:
+            self._control_segment = _attach(name)
+            self.owner = False
+        except FileNotFoundError:
+            self._control_segment = _attach(name, create=True, size=CONTROL_FIELDS * 8)
+            self.owner = True
+        self._control = np.ndarray((CONTROL_FIELDS,), dtype=np.uint64, buffer=self._control_segment.buf)
+        logger.info(f"{'Created' if self.owner else 'Attached'} shared gallery '{name}' with {len(self)} templates")
+
+    # -- segments ----------------------------------------------------------
+
+    def _segment_name(self, index: int) -> str:
+        return f"{self.name}-{index}"
+
+    def _map(self, index: int, capacity: int, dim: int, create: bool = False):
+        """Map data segment `index` and point the matrix and id columns at it"""
+        matrix_bytes = capacity * dim * 4
+        size = matrix_bytes + 2 * capacity * ID_BYTES
+        segment = _attach(self._segment_name(index), create=create, size=size if create else 0)
+        # Map it separately from the SharedMemory object: numpy keeps this mmap alive
+        # for as long as any array (say, a search still scoring old rows) uses it
+        buf = mmap.mmap(segment._fd, segment.size)
+        segment.close()
+        self._matrix = np.ndarray((capacity, dim), dtype=np.float32, buffer=buf)
+        self._template_column = np.ndarray((capacity,), dtype=f'S{ID_BYTES}', buffer=buf, offset=matrix_bytes)
+        self._employee_column = np.ndarray((capacity,), dtype=f'S{ID_BYTES}', buffer=buf, offset=matrix_bytes + capacity * ID_BYTES)
+        self._template_ids = _IdColumn(self._template_column)
+        self._employee_ids = _IdColumn(self._employee_column)
+        self._segment_index = index
+        self.dim = dim
+
+    def _attach_current(self):
+        """Follow the writer to the current data segment, if it changed"""
+        index = int(self._control[SEGMENT])
+        if index != self._segment_index and self._control[CAPACITY] > 0:
+            self._map(index, int(self._control[CAPACITY]), int(self._control[DIM]))
+
+    def unlink(self):
+        """Remove the shared segments (call once, when the whole server stops)"""
+        names = [self.name]
+        if self._control[CAPACITY]:
+            names.insert(0, self._segment_name(int(self._control[SEGMENT])))
+        for name in names:
+            _unlink(name)
+
+    # -- writer side -------------------------------------------------------
+
+    @contextmanager
+    def _write(self):
+        """Serialize writers across processes and publish the change atomically"""
+        with self._lock:
+            lock_file = open(self.lock_path, 'a')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._attach_current()
+                if int(self._control[SEQ]) % 2:
+                    # Nobody else holds the lock, so the last writer died mid-write;
+                    # the rows it touched may be partial but COUNT was never advanced
+                    logger.warning(f"Shared gallery '{self.name}': repairing a write left unfinished by a dead process")
+                    self._control[SEQ] += 1
+                    self._synced_seq = None
+                if self._synced_seq != int(self._control[SEQ]):
+                    self._sync_rows()
+                self._control[SEQ] += 1
+                try:
+                    yield
+                finally:
+                    self._control[COUNT] = self._count
+                    self._control[SEQ] += 1
+                    self._synced_seq = int(self._control[SEQ])
+            finally:
+                lock_file.close()
+
+    def _sync_rows(self):
+        """Rebuild the template-id lookup after another process wrote"""
+        self._count = int(self._control[COUNT])
+        self._rows = {} if self._template_column is None else {
+            template_id.decode('utf-8'): row for row, template_id in enumerate(self._template_column[:self._count])
+        }
+
+    def _ensure_capacity(self, rows: int):
+        capacity = int(self._control[CAPACITY])
+        if rows <= capacity:
+            return
+        new_capacity = max(self.INITIAL_CAPACITY, capacity)
+        while new_capacity < rows:
+            new_capacity *= 2
+
+        old_matrix, old_templates, old_employees = self._matrix, self._template_column, self._employee_column
+        old_index = int(self._control[SEGMENT])
+        new_index = old_index + 1 if capacity else 0
+        self._map(new_index, new_capacity, self.dim, create=True)
+        if self._count:
+            self._matrix[:self._count] = old_matrix[:self._count]
+            self._template_column[:self._count] = old_templates[:self._count]
+            self._employee_column[:self._count] = old_employees[:self._count]
+        del old_matrix, old_templates, old_employees
+
+        self._control[DIM] = self.dim
+        self._control[CAPACITY] = new_capacity
+        self._control[SEGMENT] = new_index
+        if capacity:
+            # Readers still mapping the old segment keep it until they re-attach
+            _unlink(self._segment_name(old_index))
+        logger.info(f"Shared gallery '{self.name}' grown to {new_capacity} rows")
+
+    @staticmethod
+    def _encode_id(value: str) -> bytes:
+        encoded = str(value).encode('utf-8')
+        if len(encoded) > ID_BYTES or b'\x00' in encoded:
+            raise ValueError(f"Ids in the shared gallery must be at most {ID_BYTES} bytes")
+        return encoded
+
+    def add(self, template_id: str, employee_id: str, features: Sequence[float]):
+        """Add or replace a template and publish it to every process"""
+        vector = self.normalize(features)
+        if vector.ndim != 1 or vector.size == 0:
+            raise ValueError("Template features must be a non-empty vector")
+        template_key = self._encode_id(template_id)
+        employee_key = self._encode_id(employee_id)
+
+        with self._write():
+            if self.dim is None:
+                self.dim = int(self._control[DIM]) or vector.size
+            if vector.size != self.dim:
+                raise ValueError(f"Feature length mismatch: {vector.size} vs gallery {self.dim}")
+
+            row = self._rows.get(template_id)
+            if row is None:
+                self._ensure_capacity(self._count + 1)
+                row = self._count
+                self._count += 1
+                self._rows[template_id] = row
+            self._matrix[row] = vector
+            self._template_column[row] = template_key
+            self._employee_column[row] = employee_key
+
+    def remove(self, template_id: str) -> bool:
+        """Remove one template by moving the last row into its slot"""
+        with self._write():
+            row = self._rows.pop(template_id, None)
+            if row is None:
+                return False
+            last = self._count - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._template_column[row] = self._template_column[last]
+                self._employee_column[row] = self._employee_column[last]
+                self._rows[self._template_ids[row]] = row
+            self._template_column[last] = b''
+            self._employee_column[last] = b''
+            self._count = last
+            return True
+
+    def remove_employee(self, employee_id: str) -> int:
+        """Remove every template owned by an employee"""
+        with self._lock:
+            self._attach_current()
+            count = int(self._control[COUNT])
+            if self._employee_column is None:
+                return 0
+            rows = np.flatnonzero(self._employee_column[:count] == self._encode_id(employee_id))
+            template_ids = [self._template_ids[row] for row in rows]
+            return sum(self.remove(template_id) for template_id in template_ids)
+
+    # -- reader side -------------------------------------------------------
+
+    def __len__(self) -> int:
+        return int(self._control[COUNT])
+
+    def _read_consistent(self, read: Callable[[], Any]) -> Any:
+        """Run read() against one generation: lock-free with retries, then under the write lock"""
+        deadline = time.monotonic() + self.READ_TIMEOUT
+        while time.monotonic() < deadline:
+            seq = int(self._control[SEQ])
+            if seq % 2 == 0:
+                try:
+                    self._attach_current()
+                    result = read()
+                except (FileNotFoundError, IndexError, UnicodeDecodeError):
+                    # The segment moved or shrank under us; the retry sees the new one
+                    pass
+                else:
+                    if int(self._control[SEQ]) == seq:
+                        return result
+            # A write is being published
+            time.sleep(0)
+        # Writers kept moving the counter, or one died leaving it odd: exclude them
+        # (taking the lock also repairs the counter after a dead writer)
+        with self._write():
+            return read()
+
+    def search_batch(self, probes: np.ndarray, k: int = 5) -> List[List[Dict[str, Any]]]:
+        """Top-k employees per probe against one consistent generation, without locks"""
+        probes = self.normalize(probes)
+
+        def read():
+            count = int(self._control[COUNT])
+            if count == 0:
+                return [[] for _ in range(len(probes))]
+            if probes.shape[1] != self.dim:
+                raise ValueError(f"Feature length mismatch: {probes.shape[1]} vs gallery {self.dim}")
+            scores = probes @ self._matrix[:count].T
+            return [self._top_employees(row, k) for row in scores]
+
+        return self._read_consistent(read)
+
+    def stats(self) -> Dict[str, Any]:
+        """Template count, dimension and shared segment size, from one generation"""
+        def read():
+            count = int(self._control[COUNT])
+            capacity = int(self._control[CAPACITY])
+            dim = int(self._control[DIM])
+            return {
+                "templates": count,
+                "employees": 0 if self._employee_column is None else len(set(self._employee_column[:count].tolist())),
+                "dimension": dim or None,
+                "matrix_bytes": capacity * dim * 4,
+                "shared_segment": self._segment_name(int(self._control[SEGMENT])) if capacity else None,
+                "shared_bytes": capacity * (dim * 4 + 2 * ID_BYTES),
+                "generation": int(self._control[SEQ]) // 2
+            }
+
+        return self._read_consistent(read)
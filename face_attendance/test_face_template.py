@@ -0,0 +1,115 @@
+import base64
+import json
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from face_template import (HEADER, HEADER_SIZE, MAGIC, VERSION, decode_template, encode_template,
+                           load_template_features, migrate_legacy_encoding)
+
+def expect_error(blob, message):
+    """decode_template(blob) must raise a ValueError containing message"""
+    try:
+        decode_template(blob)
+    except ValueError as e:
+        assert message in str(e), f"{e!r} does not mention {message!r}"
+        return
+    raise AssertionError(f"decode_template accepted an invalid template ({message})")
+
+def sample_features(dim=64, seed=0):
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+def test_float32_round_trip():
+    """float32 templates keep every feature bit for bit, plus the quality and header fields"""
+    features = sample_features()
+    blob = encode_template(features, 0.8125, 'float32')
+
+    assert len(blob) == HEADER_SIZE + features.size * 4
+    template = decode_template(blob)
+    assert template.version == VERSION
+    assert template.quality == 0.8125
+    assert template.features.dtype == np.dtype('<f4')
+    assert np.array_equal(template.features, features)
+
+def test_float16_round_trip():
+    """float16 templates are half the size and round each feature to the nearest half"""
+    features = sample_features(seed=1)
+    blob = encode_template(features, 0.5, 'float16')
+
+    assert len(blob) == HEADER_SIZE + features.size * 2
+    template = decode_template(blob)
+    assert template.features.dtype == np.dtype('<f2')
+    assert np.array_equal(template.features, features.astype(np.float16))
+    loaded, quality = load_template_features(blob)
+    assert loaded.dtype == np.float32 and quality == 0.5
+    assert np.abs(loaded - features).max() <= np.abs(features).max() * 2 ** -11
+
+def test_float16_special_values():
+    """Subnormals, infinities and NaN survive the float16 encoding"""
+    features = np.array([0.0, -0.0, 2 ** -24, 2 ** -14, 65504.0, np.inf, -np.inf, np.nan], dtype=np.float32)
+    decoded = decode_template(encode_template(features, 0.0, 'float16')).features.astype(np.float32)
+
+    assert np.array_equal(decoded[:7], features[:7])
+    assert np.signbit(decoded[1])
+    assert np.isnan(decoded[7])
+
+def test_base64_and_stored_bytes():
+    """Templates load from raw bytes, base64 text and base64 stored as bytes"""
+    features = sample_features(8, seed=2)
+    blob = encode_template(features, 0.25)
+    text = base64.b64encode(blob).decode('ascii')
+
+    for stored in (blob, text, text.encode('ascii')):
+        loaded, quality = load_template_features(stored)
+        assert np.array_equal(loaded, features) and quality == 0.25
+
+def test_legacy_migration():
+    """Legacy enhanced_features JSON converts to a binary template with the same features"""
+    features = sample_features(16, seed=3)
+    legacy = json.dumps({"features": features.tolist(), "quality": 0.7, "encoding_type": "enhanced_features"})
+    blob = migrate_legacy_encoding(base64.b64encode(legacy.encode('utf-8')).decode('ascii'))
+
+    template = decode_template(blob)
+    assert np.array_equal(template.features, features)
+    assert abs(template.quality - 0.7) < 1e-6
+
+def test_truncated_templates():
+    """A header or feature block cut short is rejected, never read past the end"""
+    blob = encode_template(sample_features(), 0.9)
+
+    expect_error(blob[:HEADER_SIZE - 1], "shorter than its header")
+    expect_error(blob[:HEADER_SIZE], "shorter than its feature block")
+    expect_error(blob[:-1], "shorter than its feature block")
+
+def test_wrong_magic_version_and_dtype():
+    blob = encode_template(sample_features(), 0.9)
+
+    expect_error(b'XTPL' + blob[4:], "Not a binary face template")
+    expect_error(blob[:4] + bytes([VERSION + 1]) + blob[5:], "Unsupported template version")
+    expect_error(blob[:5] + bytes([9]) + blob[6:], "Unsupported template dtype code")
+
+def test_dim_mismatch():
+    """The header's dim decides how many features are read: more than present fails, fewer ignores the rest"""
+    features = sample_features(32, seed=4)
+    payload = features.tobytes()
+
+    expect_error(HEADER.pack(MAGIC, VERSION, 1, 33, 0.5, 0) + payload, "shorter than its feature block")
+    template = decode_template(HEADER.pack(MAGIC, VERSION, 1, 16, 0.5, 0) + payload)
+    assert np.array_equal(template.features, features[:16])
+
+def test_encode_rejects_invalid_input():
+    for features, dtype in (([], 'float32'), (np.zeros(0x10000), 'float32'), ([1.0], 'int8')):
+        try:
+            encode_template(features, 0.0, dtype)
+        except ValueError:
+            continue
+        raise AssertionError(f"encode_template accepted {len(features)} features as {dtype}")
+
+if __name__ == "__main__":
+    print("🧪 Testing the binary face template format...")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
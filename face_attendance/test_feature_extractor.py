@@ -0,0 +1,103 @@
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from feature_extractor import FEATURE_DIM, extract_features_batch
+from resource_registry import registry, GABOR_KERNELS
+
+TOLERANCE = 1e-5
+
+def legacy_face_features(face_region, aspect_ratio=1.0):
+    """The per-face extractor extract_features_batch replaced, kept as the reference"""
+    gray_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
+    features = []
+
+    # 1. Histogram features
+    hist = cv2.calcHist([gray_face], [0], None, [32], [0, 256])
+    features.extend((hist.flatten() / (hist.sum() + 1e-8)).tolist())
+
+    # 2. Edge density features (multiple scales)
+    for scale in [1, 2, 4]:
+        resized = cv2.resize(gray_face, (128//scale, 128//scale))
+        edges = cv2.Canny(resized, 50, 150)
+        features.append(float(np.sum(edges > 0) / (resized.shape[0] * resized.shape[1])))
+
+    # 3. Texture features using Gabor filters
+    for kernel in registry.get(GABOR_KERNELS):
+        filtered = cv2.filter2D(gray_face, cv2.CV_8UC3, kernel)
+        features.append(float(np.mean(filtered) / 255.0))
+
+    # 4. Local Binary Pattern approximation, one cv2.Sobel call per block
+    lbp_features = []
+    for i in range(0, 128, 16):
+        for j in range(0, 128, 16):
+            block = gray_face[i:i+16, j:j+16]
+            grad_x = cv2.Sobel(block, cv2.CV_64F, 1, 0, ksize=3)
+            grad_y = cv2.Sobel(block, cv2.CV_64F, 0, 1, ksize=3)
+            gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
+            lbp_features.append(float(np.mean(gradient_magnitude) / 255.0))
+    features.extend(lbp_features[:16])
+
+    # 5. Brightness and contrast features
+    features.extend([float(np.mean(gray_face) / 255.0), float(np.std(gray_face) / 255.0)])
+
+    # 6. Shape features
+    features.append(float(aspect_ratio))
+
+    # 7. Color features
+    hsv = cv2.cvtColor(face_region, cv2.COLOR_BGR2HSV)
+    lab = cv2.cvtColor(face_region, cv2.COLOR_BGR2LAB)
+    h_mean, s_mean, v_mean = np.mean(hsv, axis=(0, 1))
+    features.extend([float(h_mean/179.0), float(s_mean/255.0), float(v_mean/255.0)])
+    l_mean, a_mean, b_mean = np.mean(lab, axis=(0, 1))
+    features.extend([float(l_mean/255.0), float(a_mean/255.0), float(b_mean/255.0)])
+    return features
+
+def sample_crops(count=12, seed=0):
+    """Noise, smooth gradients and blurred shapes, so every feature group sees varied input"""
+    rng = np.random.default_rng(seed)
+    crops = []
+    for i in range(count):
+        if i % 3 == 0:
+            crop = rng.integers(0, 256, (128, 128, 3), dtype=np.uint8)
+        elif i % 3 == 1:
+            ramp = np.linspace(0, 255, 128, dtype=np.float32)
+            crop = np.dstack([np.add.outer(ramp, ramp[::-1]) / 2, np.tile(ramp, (128, 1)), np.tile(ramp[:, None], (1, 128))])
+            crop = crop.astype(np.uint8)
+        else:
+            crop = np.full((128, 128, 3), rng.integers(0, 256, 3), dtype=np.uint8)
+            cv2.circle(crop, tuple(int(v) for v in rng.integers(20, 108, 2)), int(rng.integers(10, 50)),
+                       tuple(int(v) for v in rng.integers(0, 256, 3)), -1)
+            crop = cv2.GaussianBlur(crop, (7, 7), 2)
+        crops.append(crop)
+    return np.stack(crops)
+
+def test_batch_matches_legacy_extractor():
+    """Every row of the batch extractor equals the legacy per-face vector"""
+    crops = sample_crops()
+    aspect_ratios = np.linspace(0.7, 1.3, len(crops))
+
+    batch = extract_features_batch(crops, aspect_ratios)
+    legacy = np.array([legacy_face_features(crop, ratio) for crop, ratio in zip(crops, aspect_ratios)])
+
+    assert batch.shape == (len(crops), FEATURE_DIM)
+    assert legacy.shape == batch.shape
+    max_diff = float(np.abs(batch - legacy).max())
+    print(f"Max abs difference over {len(crops)} crops: {max_diff:.2e}")
+    assert max_diff < TOLERANCE
+
+def test_single_crop_matches_batch_row():
+    """A single (128, 128, 3) crop gives the same row as it does inside a batch, to float32 rounding"""
+    crops = sample_crops(4, seed=1)
+    batch = extract_features_batch(crops)
+    for i, crop in enumerate(crops):
+        assert np.abs(extract_features_batch(crop)[0] - batch[i]).max() < TOLERANCE
+
+if __name__ == "__main__":
+    print("🧪 Comparing extract_features_batch with the legacy per-face extractor...")
+    test_batch_matches_legacy_extractor()
+    test_single_crop_matches_batch_row()
+    print("✅ Batch features match the legacy extractor")
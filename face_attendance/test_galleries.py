@@ -0,0 +1,238 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from gallery_store import PersistentFaceGallery
+from shared_gallery import SEQ, SharedMemoryFaceGallery
+
+DIM = 16
+WRITER_TEMPLATES = 150
+
+def template_vector(index: int) -> np.ndarray:
+    """The same features for template `index` in every process"""
+    return np.random.default_rng(index).standard_normal(DIM).astype(np.float32)
+
+def top_match(gallery, index: int):
+    matches = gallery.search(template_vector(index), k=1)
+    return matches[0] if matches else None
+
+def check_add_replace_remove(gallery):
+    for i in range(3):
+        gallery.add(f"t{i}", f"e{i}", template_vector(i))
+    assert len(gallery) == 3
+    assert top_match(gallery, 1)["template_id"] == "t1"
+    assert abs(top_match(gallery, 1)["score"] - 1.0) < 1e-5
+
+    # Replacing keeps one row per template id and moves it to the new features
+    gallery.add("t1", "e1", template_vector(10))
+    assert len(gallery) == 3
+    assert top_match(gallery, 10)["template_id"] == "t1"
+    assert top_match(gallery, 1)["score"] < 0.99
+
+    assert gallery.remove("t0")
+    assert not gallery.remove("t0")
+    assert len(gallery) == 2
+    assert top_match(gallery, 0)["template_id"] != "t0"
+
+    gallery.add("t3", "e2", template_vector(3))
+    assert gallery.remove_employee("e2") == 2
+    assert [m["template_id"] for m in gallery.search(template_vector(10), k=5)] == ["t1"]
+
+def read_while_writing(gallery, start_writer):
+    """Search while another process adds templates in order: template i is found once len() > i"""
+    writer = start_writer()
+    rng = np.random.default_rng(0)
+    searches = 0
+    try:
+        while writer.is_alive() or searches == 0:
+            i = int(rng.integers(WRITER_TEMPLATES))
+            visible = len(gallery)
+            match = top_match(gallery, i)
+            if i < visible:
+                assert match["template_id"] == f"w{i}", f"w{i} missing with {visible} templates visible"
+            if match is not None:
+                assert match["score"] <= 1.0 + 1e-5
+            searches += 1
+    finally:
+        writer.join()
+    assert writer.exitcode == 0
+    assert len(gallery) == WRITER_TEMPLATES
+    assert all(top_match(gallery, i)["template_id"] == f"w{i}" for i in range(WRITER_TEMPLATES))
+    print(f"{searches} searches during the writer's {WRITER_TEMPLATES} adds")
+
+def start_process(target, *args):
+    process = multiprocessing.get_context('fork').Process(target=target, args=args)
+    process.start()
+    return process
+
+# -- PersistentFaceGallery -----------------------------------------------------
+
+class SmallPersistentGallery(PersistentFaceGallery):
+    INITIAL_CAPACITY = 4
+
+def persistent_writer(directory: str):
+    gallery = PersistentFaceGallery(directory)
+    for i in range(WRITER_TEMPLATES):
+        gallery.add(f"w{i}", f"e{i}", template_vector(i))
+
+def test_persistent_add_replace_remove():
+    with tempfile.TemporaryDirectory() as directory:
+        check_add_replace_remove(PersistentFaceGallery(directory))
+
+def test_persistent_compact_and_reopen():
+    """Compaction drops dead rows, and a second instance sees every change from the files"""
+    with tempfile.TemporaryDirectory() as directory:
+        gallery = SmallPersistentGallery(directory)
+        for i in range(10):
+            gallery.add(f"t{i}", f"e{i % 3}", template_vector(i))
+        gallery.remove("t4")
+        assert gallery.stats()["dead_rows"] == 1
+        # All 10 rows are used, so this replace first compacts t4 away, then leaves the old t5 row dead
+        gallery.add("t5", "e2", template_vector(20))
+        assert gallery.stats()["dead_rows"] == 1
+        assert gallery.stats()["snapshot_version"] == 3
+
+        reopened = SmallPersistentGallery(directory)
+        assert len(reopened) == 9
+        assert top_match(reopened, 20)["template_id"] == "t5"
+
+        version = gallery.version
+        stats = gallery.compact()
+        assert stats["dead_rows"] == 0 and stats["templates"] == 9
+        assert gallery.version == version + 1
+        assert sorted(os.listdir(directory)) == sorted([
+            "gallery.lock", "manifest.json", f"gallery-{gallery.version:06d}.npy", f"gallery-{gallery.version:06d}.journal"
+        ])
+
+        # The other instance follows the new version on its next read, and the first sees its writes
+        assert top_match(reopened, 7)["template_id"] == "t7"
+        assert reopened.version == gallery.version
+        reopened.remove("t7")
+        reopened.add("t11", "e1", template_vector(11))
+        assert len(gallery) == 9
+        assert top_match(gallery, 11)["template_id"] == "t11"
+        assert top_match(gallery, 7)["template_id"] != "t7"
+
+        assert len(SmallPersistentGallery(directory)) == 9
+
+def test_persistent_reads_while_writer_process_runs():
+    with tempfile.TemporaryDirectory() as directory:
+        gallery = PersistentFaceGallery(directory)
+        read_while_writing(gallery, lambda: start_process(persistent_writer, directory))
+
+def persistent_compactor(directory: str, seconds: float):
+    gallery = PersistentFaceGallery(directory)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        gallery.compact()
+
+def test_persistent_reads_while_another_process_compacts():
+    """Each compaction removes the previous version's files; a reader mid-refresh must follow it"""
+    with tempfile.TemporaryDirectory() as directory:
+        gallery = PersistentFaceGallery(directory)
+        for i in range(20):
+            gallery.add(f"t{i}", f"e{i}", template_vector(i))
+        compactor = start_process(persistent_compactor, directory, 1.0)
+        searches = 0
+        try:
+            while compactor.is_alive():
+                assert top_match(gallery, searches % 20)["template_id"] == f"t{searches % 20}"
+                searches += 1
+        finally:
+            compactor.join()
+        assert compactor.exitcode == 0
+        print(f"{searches} searches across {gallery.stats()['snapshot_version'] - 1} compactions")
+
+# -- SharedMemoryFaceGallery ---------------------------------------------------
+
+class SmallSharedGallery(SharedMemoryFaceGallery):
+    INITIAL_CAPACITY = 4
+
+def shared_gallery(lock_dir: str) -> SharedMemoryFaceGallery:
+    name = f"test-gallery-{os.getpid()}-{time.monotonic_ns()}"
+    return SmallSharedGallery(name, os.path.join(lock_dir, "gallery.lock"))
+
+def shared_writer(name: str, lock_path: str):
+    gallery = SmallSharedGallery(name, lock_path)
+    for i in range(WRITER_TEMPLATES):
+        gallery.add(f"w{i}", f"e{i}", template_vector(i))
+
+def dead_shared_writer(name: str, lock_path: str):
+    gallery = SmallSharedGallery(name, lock_path)
+    with gallery._write():
+        gallery._matrix[0] = 0
+        os._exit(0)
+
+def test_shared_add_replace_remove():
+    with tempfile.TemporaryDirectory() as lock_dir:
+        gallery = shared_gallery(lock_dir)
+        try:
+            check_add_replace_remove(gallery)
+        finally:
+            gallery.unlink()
+
+def test_shared_growth_seen_by_second_instance():
+    """Growing into a new data segment is followed by an instance attached before the growth"""
+    with tempfile.TemporaryDirectory() as lock_dir:
+        gallery = shared_gallery(lock_dir)
+        try:
+            other = SmallSharedGallery(gallery.name, gallery.lock_path)
+            assert gallery.owner and not other.owner
+            for i in range(10):
+                gallery.add(f"t{i}", f"e{i}", template_vector(i))
+            assert gallery.stats()["shared_bytes"] == 16 * (DIM * 4 + 128)
+
+            assert len(other) == 10
+            assert all(top_match(other, i)["template_id"] == f"t{i}" for i in range(10))
+            assert other.remove("t3")
+            gallery.add("t10", "e10", template_vector(10))
+            assert top_match(gallery, 3)["template_id"] != "t3"
+            assert top_match(other, 10)["template_id"] == "t10"
+        finally:
+            gallery.unlink()
+
+def test_shared_reads_while_writer_process_runs():
+    with tempfile.TemporaryDirectory() as lock_dir:
+        gallery = shared_gallery(lock_dir)
+        try:
+            read_while_writing(gallery, lambda: start_process(shared_writer, gallery.name, gallery.lock_path))
+        finally:
+            gallery.unlink()
+
+def test_shared_repairs_sequence_left_odd_by_dead_writer():
+    """A writer killed mid-write leaves SEQ odd; readers fall back to the lock, which repairs it"""
+    with tempfile.TemporaryDirectory() as lock_dir:
+        gallery = shared_gallery(lock_dir)
+        gallery.READ_TIMEOUT = 0.05
+        try:
+            gallery.add("t0", "e0", template_vector(0))
+            gallery.add("t1", "e1", template_vector(1))
+            writer = start_process(dead_shared_writer, gallery.name, gallery.lock_path)
+            writer.join()
+            assert int(gallery._control[SEQ]) % 2 == 1
+
+            started = time.monotonic()
+            assert top_match(gallery, 1)["template_id"] == "t1"
+            assert time.monotonic() - started >= gallery.READ_TIMEOUT
+            assert int(gallery._control[SEQ]) % 2 == 0
+
+            # Lock-free reads work again, and so do writes
+            started = time.monotonic()
+            assert len(gallery) == 2 and top_match(gallery, 1)["template_id"] == "t1"
+            assert time.monotonic() - started < gallery.READ_TIMEOUT
+            gallery.add("t2", "e2", template_vector(2))
+            assert top_match(gallery, 2)["template_id"] == "t2"
+        finally:
+            gallery.unlink()
+
+if __name__ == "__main__":
+    print("🧪 Testing the persistent and shared-memory galleries...")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
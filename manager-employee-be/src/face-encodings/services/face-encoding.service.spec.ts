@@ -0,0 +1,127 @@
+import { Test, TestingModule } from '@nestjs/testing';
+import { PrismaService } from '../../prisma/prisma.service';
+import { FaceEncodingService } from './face-encoding.service';
+
+// Templates written by face_attendance/src/face_template.py encode_template():
+// [0.5, -1.25, 3.0] at quality 0.75 as float32, and
+// [0.5, -1.25, 3.0, 2 ** -24, 65504] at quality 0.75 as float16
+const FLOAT32_TEMPLATE =
+  '4654504c010103000000403f000000000000003f0000a0bf00004040';
+const FLOAT16_TEMPLATE = '4654504c010205000000403f00000000003800bd00420100ff7b';
+
+function template(dtype: number, dim: number, payload: Buffer): Buffer {
+  const header = Buffer.alloc(16);
+  header.write('FTPL', 0, 'ascii');
+  header.writeUInt8(1, 4);
+  header.writeUInt8(dtype, 5);
+  header.writeUInt16LE(dim, 6);
+  header.writeFloatLE(0.5, 8);
+  return Buffer.concat([header, payload]);
+}
+
+describe('FaceEncodingService binary templates', () => {
+  let service: FaceEncodingService;
+  let halfToFloat: (half: number) => number;
+  let decodeBinaryTemplate: (encoding: Buffer) => number[];
+
+  beforeEach(async () => {
+    const module: TestingModule = await Test.createTestingModule({
+      providers: [FaceEncodingService, { provide: PrismaService, useValue: {} }],
+    }).compile();
+
+    service = module.get<FaceEncodingService>(FaceEncodingService);
+    halfToFloat = (service as any).halfToFloat.bind(service);
+    decodeBinaryTemplate = (service as any).decodeBinaryTemplate.bind(service);
+    jest.spyOn(console, 'log').mockImplementation(() => undefined);
+    jest.spyOn(console, 'error').mockImplementation(() => undefined);
+  });
+
+  afterEach(() => {
+    jest.restoreAllMocks();
+  });
+
+  it('decodes float32 templates from the Python service', async () => {
+    const features = await service.extractFeaturesFromEncoding(
+      Buffer.from(FLOAT32_TEMPLATE, 'hex'),
+    );
+    expect(features).toEqual([0.5, -1.25, 3.0]);
+  });
+
+  it('decodes float16 templates from the Python service', async () => {
+    const features = await service.extractFeaturesFromEncoding(
+      Buffer.from(FLOAT16_TEMPLATE, 'hex'),
+    );
+    expect(features).toEqual([0.5, -1.25, 3.0, Math.pow(2, -24), 65504]);
+  });
+
+  it('round-trips float32 features written with Buffer', () => {
+    const values = [0.1, -2.5, 1e-30, 123456.789];
+    const payload = Buffer.alloc(values.length * 4);
+    values.forEach((value, i) => payload.writeFloatLE(value, i * 4));
+
+    const features = decodeBinaryTemplate(template(1, values.length, payload));
+    features.forEach((feature, i) =>
+      expect(feature).toBe(Math.fround(values[i])),
+    );
+  });
+
+  it('converts normal, zero and signed half floats', () => {
+    expect(halfToFloat(0x3c00)).toBe(1);
+    expect(halfToFloat(0xc000)).toBe(-2);
+    expect(halfToFloat(0x3555)).toBeCloseTo(0.333251953125, 12);
+    expect(halfToFloat(0x7bff)).toBe(65504);
+    expect(halfToFloat(0x0400)).toBe(Math.pow(2, -14));
+    expect(halfToFloat(0x0000)).toBe(0);
+    expect(Object.is(halfToFloat(0x8000), -0)).toBe(true);
+  });
+
+  it('converts subnormal half floats', () => {
+    expect(halfToFloat(0x0001)).toBe(Math.pow(2, -24));
+    expect(halfToFloat(0x03ff)).toBe((1023 / 1024) * Math.pow(2, -14));
+    expect(halfToFloat(0x8001)).toBe(-Math.pow(2, -24));
+  });
+
+  it('converts infinities and NaN', () => {
+    expect(halfToFloat(0x7c00)).toBe(Infinity);
+    expect(halfToFloat(0xfc00)).toBe(-Infinity);
+    expect(halfToFloat(0x7e00)).toBeNaN();
+    expect(halfToFloat(0xfc01)).toBeNaN();
+  });
+
+  it('rejects truncated templates', async () => {
+    const full = Buffer.from(FLOAT16_TEMPLATE, 'hex');
+    expect(() => decodeBinaryTemplate(full.subarray(0, full.length - 1))).toThrow(
+      'shorter than its 5 features',
+    );
+    expect(() => decodeBinaryTemplate(template(1, 4, Buffer.alloc(12)))).toThrow(
+      'shorter than its 4 features',
+    );
+    await expect(
+      service.extractFeaturesFromEncoding(full.subarray(0, 20)),
+    ).resolves.toEqual([]);
+  });
+
+  it('rejects unknown versions and dtypes', () => {
+    const versioned = Buffer.from(FLOAT32_TEMPLATE, 'hex');
+    versioned.writeUInt8(2, 4);
+    expect(() => decodeBinaryTemplate(versioned)).toThrow(
+      'Unsupported template version: 2',
+    );
+    expect(() => decodeBinaryTemplate(template(3, 1, Buffer.alloc(4)))).toThrow(
+      'Unsupported template dtype: 3',
+    );
+  });
+
+  it('treats buffers without the FTPL magic as legacy JSON encodings', async () => {
+    const legacy = Buffer.from(JSON.stringify({ features: [0.25, 0.75] }));
+    await expect(service.extractFeaturesFromEncoding(legacy)).resolves.toEqual([
+      0.25, 0.75,
+    ]);
+
+    const wrongMagic = Buffer.from(FLOAT32_TEMPLATE, 'hex');
+    wrongMagic.write('XTPL', 0, 'ascii');
+    await expect(
+      service.extractFeaturesFromEncoding(wrongMagic),
+    ).resolves.toEqual([]);
+  });
+});
@@ -98,6 +98,13 @@ export class FaceEncodingService {
   // Helper method to extract features from stored encoding
   async extractFeaturesFromEncoding(encoding: Buffer): Promise<number[]> {
     try {
+      // Binary face template from the Python service (encodingFormat: 'binary')
+      if (this.isBinaryTemplate(encoding)) {
+        const features = this.decodeBinaryTemplate(encoding);
+        console.log(`🔍 Extracted ${features.length} features from binary template`);
+        return features;
+      }
+
       // The encoding is stored as base64 buffer, so decode it first
       const base64String = encoding.toString('base64');
       console.log(`🔍 Decoded base64 string length: ${base64String.length}`);
@@ -132,4 +139,51 @@ export class FaceEncodingService {
       return [];
     }
   }
+
+  // Binary template layout (little-endian), see face_attendance/src/face_template.py:
+  // 'FTPL' magic, uint8 version, uint8 dtype (1 = float32, 2 = float16),
+  // uint16 dim, float32 quality, uint32 reserved, then dim packed features
+  private isBinaryTemplate(encoding: Buffer): boolean {
+    return encoding.length >= 16 && encoding.toString('ascii', 0, 4) === 'FTPL';
+  }
+
+  private decodeBinaryTemplate(encoding: Buffer): number[] {
+    const version = encoding.readUInt8(4);
+    const dtype = encoding.readUInt8(5);
+    const dim = encoding.readUInt16LE(6);
+    if (version !== 1) {
+      throw new Error(`Unsupported template version: ${version}`);
+    }
+    if (dtype !== 1 && dtype !== 2) {
+      throw new Error(`Unsupported template dtype: ${dtype}`);
+    }
+    if (encoding.length < 16 + dim * (dtype === 1 ? 4 : 2)) {
+      throw new Error(`Template is shorter than its ${dim} features`);
+    }
+
+    const features: number[] = new Array(dim);
+    if (dtype === 1) {
+      for (let i = 0; i < dim; i++) {
+        features[i] = encoding.readFloatLE(16 + i * 4);
+      }
+    } else {
+      for (let i = 0; i < dim; i++) {
+        features[i] = this.halfToFloat(encoding.readUInt16LE(16 + i * 2));
+      }
+    }
+    return features;
+  }
+
+  private halfToFloat(half: number): number {
+    const sign = half & 0x8000 ? -1 : 1;
+    const exponent = (half >> 10) & 0x1f;
+    const fraction = half & 0x3ff;
+    if (exponent === 0) {
+      return sign * Math.pow(2, -14) * (fraction / 1024);
+    }
+    if (exponent === 0x1f) {
+      return fraction ? NaN : sign * Infinity;
+    }
+    return sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+  }
 } 
\ No newline at end of file